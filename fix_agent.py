@@ -1,6 +1,5 @@
 # fix_agent.py - Improved version with better area matching
 import os
-import streamlit as st
 import sqlite3
 import sys
 import json
@@ -9,6 +8,12 @@ import traceback
 from typing import Optional, Dict, List, Any, Union
 from difflib import SequenceMatcher
 
+# Streamlit is only needed for the session fallback when running inside the app
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+
 # Function to get a database connection
 def get_db_connection(db_path='data/properties.db'):
     """Get a database connection with row factory"""
@@ -272,7 +277,8 @@ def search_properties(query=None):
             "properties": [],
             "exact_match": False,
             "count": 0,
-            "advice": f"An error occurred while searching for properties. Please try again."
+            "advice": f"An error occurred while searching for properties. Please try again.",
+            "error": str(e)
         }
 
 # Improved property search implementation
@@ -284,8 +290,9 @@ def improved_property_search(**kwargs):
     try:
         print(f"Debug - improved_property_search called with kwargs: {kwargs}")
         
-        # Get database connection
-        conn = get_db_connection()
+        # Get a connection to the caller's database, if given
+        db_path = kwargs.get('db_path') or 'data/properties.db'
+        conn = get_db_connection(db_path)
         cursor = conn.cursor()
         
         # Extract search parameters
@@ -297,19 +304,22 @@ def improved_property_search(**kwargs):
         possession_date = kwargs.get('possession_date')
         min_size = kwargs.get('min_size')
         max_size = kwargs.get('max_size')
+        session_id = kwargs.get('session_id')
         
         # Debug output
         print(f"Search parameters: area={area}, property_type={property_type}, "
               f"budget={min_budget}-{max_budget}, config={configurations}, "
               f"possession={possession_date}, size={min_size}-{max_size}")
         
-        # Try to store preferences if this is a Streamlit app session
+        # Try to store preferences for the caller's session, falling back to the Streamlit app session
         try:
-            if hasattr(st, 'session_state') and 'session_id' in st.session_state and any([area, property_type, min_budget, max_budget, configurations, possession_date, min_size, max_size]):
+            if session_id is None and hasattr(st, 'session_state') and 'session_id' in st.session_state:
+                session_id = st.session_state.session_id
+            if session_id is not None and any([area, property_type, min_budget, max_budget, configurations, possession_date, min_size, max_size]):
                 try:
                     from utils.db_setup import store_user_preferences
                     store_user_preferences(
-                        session_id=st.session_state.session_id,
+                        session_id=session_id,
                         area=area,
                         property_type=property_type,
                         min_budget=min_budget,
@@ -318,7 +328,7 @@ def improved_property_search(**kwargs):
                         possession_date=possession_date,
                         min_size=min_size,
                         max_size=max_size,
-                        db_path='data/properties.db'
+                        db_path=db_path
                     )
                 except ImportError:
                     print("Non-critical: Could not import store_user_preferences")
@@ -333,7 +343,7 @@ def improved_property_search(**kwargs):
             print(f"Starting enhanced location search for area: {area}")
             
             # Use the improved area matching algorithm
-            potential_matches = find_area_matches(area)
+            potential_matches = find_area_matches(area, db_path)
             print(f"Potential area matches: {potential_matches}")
             
             # If we have matches with good scores, use them
@@ -589,19 +599,18 @@ def improved_property_search(**kwargs):
             "properties": [],
             "exact_match": False,
             "count": 0,
-            "advice": f"An error occurred while searching for properties. Please try again with different criteria."
+            "advice": f"An error occurred while searching for properties. Please try again with different criteria.",
+            "error": str(e)
         }
 
 # Helper functions for the agent
-def get_user_preferences():
-    """Get user preferences from the database."""
+def get_user_preferences(session_id=None, db_path='data/properties.db'):
+    """Get user preferences from the database, for session_id or the Streamlit session."""
     try:
-        db_path = 'data/properties.db'
-        
-        # Get the session ID from Streamlit
-        if hasattr(st, 'session_state') and 'session_id' in st.session_state:
+        # Fall back to the session ID from Streamlit
+        if session_id is None and hasattr(st, 'session_state') and 'session_id' in st.session_state:
             session_id = st.session_state.session_id
-        else:
+        if session_id is None:
             return {
                 "has_preferences": False,
                 "message": "Session not initialized. Your preferences will be saved once you search for properties."
@@ -4,9 +4,12 @@ import os
 import sys
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify
 import logging
 from datetime import datetime
+from collections import OrderedDict
 import uuid
 from typing import Dict, Any, List, Optional
 import socket
@@ -33,8 +36,12 @@ logger = logging.getLogger(__name__)
 # Create Flask app
 app = Flask(__name__)
 
-# Store user sessions with enhanced data
-user_sessions = {}
+# Store user sessions with enhanced data, in least-recently-active first
+# order so the oldest can be evicted
+user_sessions = OrderedDict()
+
+# Cap on the number of sessions kept in memory
+MAX_SESSIONS = int(os.environ.get('WHATSAPP_MAX_SESSIONS', '50000'))
 
 # Get your verify token from env vars or use a default 
 WHATSAPP_VERIFY_TOKEN = os.environ.get('WHATSAPP_VERIFY_TOKEN', 'your_verify_token')
@@ -47,6 +54,14 @@ logger.info(f"Using WhatsApp API URL: {WHATSAPP_API_URL}")
 logger.info(f"Using WhatsApp Phone Number ID: {WHATSAPP_PHONE_NUMBER_ID}")
 logger.info(f"API Token (first 5 chars): {WHATSAPP_API_TOKEN[:5] if WHATSAPP_API_TOKEN else 'None'}")
 
+# Shared HTTP session so Graph API calls reuse keep-alive TLS connections
+_WA_SESSION = requests.Session()
+_WA_SESSION.headers.update({
+    'Content-Type': 'application/json',
+    'Authorization': f'Bearer {WHATSAPP_API_TOKEN}'
+})
+_WA_SESSION.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=Retry(total=2, backoff_factor=0.2)))
+
 # Initialize your agent - ENHANCED INITIALIZATION LIKE APP.PY
 if "agent" not in globals():
     try:
@@ -149,11 +164,6 @@ def send_whatsapp_message(recipient_id: str, message: str) -> Dict:
     Returns:
         Dict: Response from the WhatsApp API
     """
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {WHATSAPP_API_TOKEN}'
-    }
-    
     payload = {
         'messaging_product': 'whatsapp',
         'recipient_type': 'individual',
@@ -168,9 +178,8 @@ def send_whatsapp_message(recipient_id: str, message: str) -> Dict:
         # Log request details (without full token for security)
         logger.info(f"Sending message to {recipient_id}: {message[:100]}...")
         
-        response = requests.post(
+        response = _WA_SESSION.post(
             WHATSAPP_API_URL,
-            headers=headers,
             json=payload
         )
         
@@ -223,9 +232,15 @@ def get_or_create_session(sender_id: str) -> str:
             "conversation_history": []
         }
         logger.info(f"Created new session for {sender_id}: {user_sessions[sender_id]['session_id']}")
+        
+        # Evict the least recently active sessions beyond the cap
+        while len(user_sessions) > MAX_SESSIONS:
+            evicted_id, _ = user_sessions.popitem(last=False)
+            logger.info(f"Evicted session for inactive user {evicted_id}")
     
     # Update last activity
     user_sessions[sender_id]["last_activity"] = datetime.now()
+    user_sessions.move_to_end(sender_id)
     return user_sessions[sender_id]["session_id"]
 
 # ENHANCED FUNCTION FROM APP.PY - Extract property data from response
@@ -150,6 +150,47 @@ class TestPropertyTools(unittest.TestCase):
         for result in results:
             self.assertEqual(result['type'], 'Apartment')
     
+    def test_area_index_lookup(self):
+        """Test area lookups through the inverted index"""
+        # Exact (case-insensitive) area name
+        rows = self.property_tools._area_rows('hitech city')
+        self.assertEqual(list(self.test_data.iloc[rows]['ProjectName']), ['Premium Apartments'])
+        
+        # Single word of a multi-word area name
+        rows = self.property_tools._area_rows('Hitech')
+        self.assertEqual(list(self.test_data.iloc[rows]['ProjectName']), ['Premium Apartments'])
+        
+        # Partial names fall back to substring matching
+        rows = self.property_tools._area_rows('Gachi')
+        self.assertEqual(list(self.test_data.iloc[rows]['ProjectName']), ['Luxury Towers'])
+        
+        # Unknown areas return no rows
+        self.assertEqual(len(self.property_tools._area_rows('Unknown Area')), 0)
+    
+    def test_budget_rows(self):
+        """Test budget lookups through the sorted price index"""
+        # Minimum total prices: 12M, 2.4M, 14M, 7.2M, 1.75M
+        rows = self.property_tools._budget_rows(2000000, 10000000)
+        self.assertEqual(sorted(rows.tolist()), [1, 3])
+        
+        rows = self.property_tools._budget_rows(None, 2400000)
+        self.assertEqual(sorted(rows.tolist()), [1, 4])
+        
+        rows = self.property_tools._budget_rows(12000000, None)
+        self.assertEqual(sorted(rows.tolist()), [0, 2])
+    
+    def test_filter_counts_are_deterministic(self):
+        """Test that filter counts follow the fixed filter order regardless of earlier queries"""
+        _, first = self.property_tools._filter_properties(
+            'Gachibowli', None, None, None, '6BHK', None, None, None)
+        self.assertEqual(list(first), ['initial', 'area', 'configurations'])
+        self.assertEqual(first['configurations'], 0)
+        
+        self.property_tools._filter_properties(None, None, None, None, '6BHK', None, None, None)
+        _, again = self.property_tools._filter_properties(
+            'Gachibowli', None, None, None, '6BHK', None, None, None)
+        self.assertEqual(again, first)
+    
     def test_get_unique_areas(self):
         """Test getting unique areas"""
         areas = self.property_tools.get_unique_areas()
@@ -161,6 +202,12 @@ class TestPropertyTools(unittest.TestCase):
         
         # Check that the count matches
         self.assertEqual(len(areas), len(expected_areas))
+        
+        # Modifying the returned list must not change later results
+        before = list(areas)
+        areas.append('Unknown Area')
+        areas.sort()
+        self.assertEqual(self.property_tools.get_unique_areas(), before)
     
     def test_get_property_types(self):
         """Test getting property types"""
@@ -172,6 +219,10 @@ class TestPropertyTools(unittest.TestCase):
         
         # Check count
         self.assertEqual(len(property_types), 2)
+        
+        # Modifying the returned list must not change later results
+        property_types.clear()
+        self.assertEqual(len(self.property_tools.get_property_types()), 2)
     
     def test_get_configurations(self):
         """Test getting configurations"""
@@ -181,6 +232,10 @@ class TestPropertyTools(unittest.TestCase):
         expected_configs = ['3BHK, 4BHK', '1BHK, 2BHK', '3BHK, 4BHK, 5BHK', '2BHK, 3BHK, 4BHK']
         for config in expected_configs:
             self.assertIn(config, configurations)
+        
+        # Modifying the returned list must not change later results
+        configurations.remove('1BHK, 2BHK')
+        self.assertIn('1BHK, 2BHK', self.property_tools.get_configurations())
     
     def test_get_price_range(self):
         """Test getting price range"""
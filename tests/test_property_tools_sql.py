@@ -0,0 +1,86 @@
+# tests/test_property_tools_sql.py - Tests for the SQL property tools
+
+import unittest
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import pandas as pd
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db_setup import import_csv_to_db, refresh_properties_flat
+from utils.property_tools_sql import PropertyRecommendationToolsSQL
+
+class TestPropertyToolsSQL(unittest.TestCase):
+    """Test cases for the PropertyRecommendationToolsSQL class"""
+
+    def setUp(self):
+        """Set up a database imported from a small CSV"""
+        self.temp_dir = tempfile.mkdtemp()
+        csv_path = os.path.join(self.temp_dir, 'properties.csv')
+        self.db_path = os.path.join(self.temp_dir, 'properties.db')
+
+        pd.DataFrame({
+            'ProjectName': ['Luxury Towers', 'Budget Homes', 'Mid-Range Villas'],
+            'PropertyType': ['Apartment', 'Apartment', 'Villa'],
+            'Area': ['Gachibowli', 'Bachupally', 'Kondapur'],
+            'PossessionDate': ['1/1/2025', '6/1/2025', '12/1/2024'],
+            'TotalUnits': [100, 500, 50],
+            'AreaSizeAcres': [5.0, 20.0, 10.0],
+            'Configurations': ['3BHK, 4BHK', '1BHK, 2BHK', '3BHK, 4BHK, 5BHK'],
+            'MinSizeSqft': [1500, 600, 2000],
+            'MaxSizeSqft': [2500, 1000, 3500],
+            'PricePerSqft': [8000, 4000, 7000]
+        }).to_csv(csv_path, index=False)
+        import_csv_to_db(csv_path, self.db_path)
+
+    def tearDown(self):
+        """Remove the temporary database"""
+        shutil.rmtree(self.temp_dir)
+
+    def test_in_place_edit_rebuilds_search_tables(self):
+        """Test that a new tools instance sees an edit that keeps lengths and totals the same"""
+        tools = PropertyRecommendationToolsSQL(self.db_path)
+        self.assertIn('Kondapur', tools.get_unique_areas())
+        tools.close()
+
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute("UPDATE properties SET area = 'Madhapur' WHERE area = 'Kondapur'")
+        conn.close()
+
+        tools = PropertyRecommendationToolsSQL(self.db_path)
+        try:
+            areas = tools.get_unique_areas()
+            self.assertIn('Madhapur', areas)
+            self.assertNotIn('Kondapur', areas)
+
+            properties, _, exact_match = tools.search_properties(area='Madhapur')
+            self.assertTrue(exact_match)
+            self.assertEqual([p['name'] for p in properties], ['Mid-Range Villas'])
+        finally:
+            tools.close()
+
+    def test_rebuild_by_another_connection_refreshes_caches(self):
+        """Test that cached lookups follow a rebuild made through another connection"""
+        tools = PropertyRecommendationToolsSQL(self.db_path)
+        try:
+            self.assertIn('Kondapur', tools.get_unique_areas())
+            self.assertEqual(len(tools._area_only('Kondapur', 5)), 1)
+
+            conn = sqlite3.connect(self.db_path)
+            with conn:
+                conn.execute("UPDATE properties SET area = 'Madhapur' WHERE area = 'Kondapur'")
+            refresh_properties_flat(conn)
+            conn.close()
+
+            self.assertIn('Madhapur', tools.get_unique_areas())
+            self.assertEqual(tools._area_only('Kondapur', 5), ())
+        finally:
+            tools.close()
+
+if __name__ == '__main__':
+    unittest.main()
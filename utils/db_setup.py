@@ -1,4 +1,5 @@
 # Fixed utils/db_setup.py
+import hashlib
 import os
 import sqlite3
 import pandas as pd
@@ -71,10 +72,149 @@ def create_db_schema(db_path: str = 'data/properties.db'):
     
     # Commit and close
     conn.commit()
+    
+    # Create the (empty) denormalized search table alongside the schema
+    refresh_properties_flat(conn)
     conn.close()
     
     print(f"Database schema created at {db_path}")
 
+def refresh_properties_flat(conn: sqlite3.Connection):
+    """
+    Rebuild the denormalized tables used by the property search
+    
+    properties_flat holds one row per property with its total prices and
+    comma-separated configurations precomputed, so searches need no joins.
+    Possession dates are normalized into an indexed ready flag and year.
+    property_configurations_idx maps configuration names to property IDs
+    for configuration membership tests, and properties_fts is a full-text
+    index over the project name, area and possession date. The source data
+    signature is stored in properties_flat_meta for ensure_properties_flat.
+    
+    Args:
+        conn: Open connection to the property database
+    """
+    conn.executescript('''
+    BEGIN;
+    
+    DROP TABLE IF EXISTS properties_flat;
+    CREATE TABLE properties_flat (
+        id INTEGER PRIMARY KEY,
+        project_name TEXT NOT NULL,
+        property_type TEXT NOT NULL,
+        area TEXT NOT NULL,
+        possession_date TEXT NOT NULL,
+        min_size_sqft INTEGER NOT NULL,
+        max_size_sqft INTEGER NOT NULL,
+        price_per_sqft INTEGER NOT NULL,
+        min_total_price INTEGER NOT NULL,
+        max_total_price INTEGER NOT NULL,
+        configurations TEXT,
+        possession_ready INTEGER NOT NULL,
+        possession_year INTEGER
+    );
+    INSERT INTO properties_flat
+    SELECT 
+        p.id, p.project_name, p.property_type, p.area, p.possession_date,
+        p.min_size_sqft, p.max_size_sqft, p.price_per_sqft,
+        (p.min_size_sqft * p.price_per_sqft),
+        (p.max_size_sqft * p.price_per_sqft),
+        GROUP_CONCAT(c.name, ', '),
+        (LOWER(p.possession_date) LIKE '%ready%'),
+        CASE WHEN p.possession_date GLOB '*[0-9][0-9][0-9][0-9]'
+             THEN CAST(substr(p.possession_date, -4) AS INTEGER) END
+    FROM properties p
+    LEFT JOIN property_configurations pc ON p.id = pc.property_id
+    LEFT JOIN configurations c ON pc.configuration_id = c.id
+    GROUP BY p.id;
+    
+    -- Indexes matching the search filters and budget orderings
+    CREATE INDEX idx_pf_area_type ON properties_flat(area, property_type);
+    CREATE INDEX idx_pf_size ON properties_flat(max_size_sqft, min_size_sqft);
+    CREATE INDEX idx_pf_possession ON properties_flat(possession_date);
+    CREATE INDEX idx_pf_possession_flags ON properties_flat(possession_ready, possession_year);
+    CREATE INDEX idx_pf_min_total_price ON properties_flat(min_total_price);
+    CREATE INDEX idx_pf_max_total_price ON properties_flat(max_total_price);
+    
+    DROP TABLE IF EXISTS property_configurations_idx;
+    CREATE TABLE property_configurations_idx (
+        config_name TEXT NOT NULL,
+        property_id INTEGER NOT NULL,
+        PRIMARY KEY (config_name, property_id)
+    ) WITHOUT ROWID;
+    INSERT INTO property_configurations_idx
+    SELECT c.name, pc.property_id
+    FROM property_configurations pc
+    JOIN configurations c ON pc.configuration_id = c.id;
+    
+    -- Full-text index over the free-text columns, kept external to
+    -- properties_flat so the text is stored only once
+    DROP TABLE IF EXISTS properties_fts;
+    CREATE VIRTUAL TABLE properties_fts USING fts5(
+        project_name, area, possession_date,
+        content='properties_flat', content_rowid='id',
+        tokenize='porter unicode61'
+    );
+    INSERT INTO properties_fts(properties_fts) VALUES('rebuild');
+    
+    ANALYZE properties_flat;
+    ANALYZE property_configurations_idx;
+    
+    COMMIT;
+    ''')
+    
+    # Record which source data the tables were built from
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS properties_flat_meta (source_signature TEXT NOT NULL)")
+        conn.execute("DELETE FROM properties_flat_meta")
+        conn.execute("INSERT INTO properties_flat_meta (source_signature) VALUES (?)", (_source_signature(conn),))
+
+# Source tables the search tables are derived from, in the order they are hashed
+_SOURCE_TABLES = ('properties', 'property_configurations', 'configurations')
+
+def _source_signature(conn: sqlite3.Connection) -> str:
+    """
+    Fingerprint the contents of the source tables
+    
+    Every row is hashed in a fixed order, so any insert, delete or edit
+    (including one that keeps lengths and totals the same) changes it
+    
+    Args:
+        conn: Open connection to the property database
+        
+    Returns:
+        str: Hex digest of the ordered rows
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for table in _SOURCE_TABLES:
+        digest.update(table.encode())
+        for row in conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2"):
+            digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+def ensure_properties_flat(conn: sqlite3.Connection) -> bool:
+    """
+    Rebuild the denormalized search tables only if they are missing or
+    were built from different source data
+    
+    Args:
+        conn: Open connection to the property database
+        
+    Returns:
+        bool: True if the tables were rebuilt
+    """
+    existing = {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE name IN "
+        "('properties_flat', 'property_configurations_idx', 'properties_fts', 'properties_flat_meta')"
+    )}
+    if len(existing) == 4:
+        row = conn.execute("SELECT source_signature FROM properties_flat_meta").fetchone()
+        if row and row[0] == _source_signature(conn):
+            return False
+    
+    refresh_properties_flat(conn)
+    return True
+
 def import_csv_to_db(csv_path: str, db_path: str = 'data/properties.db'):
     """
     Import property data from CSV to SQLite database with encoding detection
@@ -185,8 +325,9 @@ def import_csv_to_db(csv_path: str, db_path: str = 'data/properties.db'):
             # Continue with next row instead of failing completely
             continue
     
-    # Commit and close
+    # Commit, then rebuild the denormalized search tables from the new data
     conn.commit()
+    refresh_properties_flat(conn)
     conn.close()
     
     print(f"Successfully imported {len(df)} properties from {csv_path} to {db_path}")
@@ -221,7 +362,8 @@ def store_user_preferences(
     possession_date: Optional[str] = None,
     min_size: Optional[float] = None,
     max_size: Optional[float] = None,
-    db_path: str = 'data/properties.db'
+    db_path: str = 'data/properties.db',
+    conn: Optional[sqlite3.Connection] = None
 ):
     """
     Store or update user preferences in the database
@@ -237,47 +379,52 @@ def store_user_preferences(
         min_size: Minimum property size in sqft
         max_size: Maximum property size in sqft
         db_path: Path to the SQLite database file
+        conn: Open connection to reuse instead of opening one from db_path;
+            it is left open
     """
-    conn = get_connection(db_path)
-    cursor = conn.cursor()
-    
-    # Check if preferences already exist for this session
-    cursor.execute('SELECT * FROM user_preferences WHERE session_id = ?', (session_id,))
-    existing = cursor.fetchone()
-    
-    if existing:
-        # Update existing preferences
-        cursor.execute('''
-        UPDATE user_preferences
-        SET area = COALESCE(?, area),
-            property_type = COALESCE(?, property_type),
-            min_budget = COALESCE(?, min_budget),
-            max_budget = COALESCE(?, max_budget),
-            configuration = COALESCE(?, configuration),
-            possession_date = COALESCE(?, possession_date),
-            min_size = COALESCE(?, min_size),
-            max_size = COALESCE(?, max_size),
-            last_updated = CURRENT_TIMESTAMP
-        WHERE session_id = ?
-        ''', (
-            area, property_type, min_budget, max_budget,
-            configuration, possession_date, min_size, max_size,
-            session_id
-        ))
-    else:
-        # Insert new preferences
-        cursor.execute('''
-        INSERT INTO user_preferences (
-            session_id, area, property_type, min_budget, max_budget,
-            configuration, possession_date, min_size, max_size
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            session_id, area, property_type, min_budget, max_budget,
-            configuration, possession_date, min_size, max_size
-        ))
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection(db_path)
     
-    conn.commit()
-    conn.close()
+    try:
+        # Write in a single transaction, committed on exit
+        with conn:
+            # Check if preferences already exist for this session
+            existing = conn.execute('SELECT 1 FROM user_preferences WHERE session_id = ?', (session_id,)).fetchone()
+        
+            if existing:
+                # Update existing preferences
+                conn.execute('''
+                UPDATE user_preferences
+                SET area = COALESCE(?, area),
+                    property_type = COALESCE(?, property_type),
+                    min_budget = COALESCE(?, min_budget),
+                    max_budget = COALESCE(?, max_budget),
+                    configuration = COALESCE(?, configuration),
+                    possession_date = COALESCE(?, possession_date),
+                    min_size = COALESCE(?, min_size),
+                    max_size = COALESCE(?, max_size),
+                    last_updated = CURRENT_TIMESTAMP
+                WHERE session_id = ?
+                ''', (
+                    area, property_type, min_budget, max_budget,
+                    configuration, possession_date, min_size, max_size,
+                    session_id
+                ))
+            else:
+                # Insert new preferences
+                conn.execute('''
+                INSERT INTO user_preferences (
+                    session_id, area, property_type, min_budget, max_budget,
+                    configuration, possession_date, min_size, max_size
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    session_id, area, property_type, min_budget, max_budget,
+                    configuration, possession_date, min_size, max_size
+                ))
+    finally:
+        if own_conn:
+            conn.close()
 
 def get_user_preferences(session_id: str, db_path: str = 'data/properties.db'):
     """
@@ -4,6 +4,9 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 
+# Number of set bits in every byte value, used to count packed row masks
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
 class PropertyRecommendationTools:
     """
     Tools for searching and filtering property data with enhanced recommendation capabilities
@@ -39,6 +42,97 @@ class PropertyRecommendationTools:
                 else:
                     self.df[col] = 'N/A'
         
+        # Cache the distinct values served by the metadata getters; the
+        # dataset is static after load so there is no need to rescan per call.
+        # The getters return copies so callers can't modify the cache
+        self._unique_areas = self._distinct_values('Area')
+        self._property_types = self._distinct_values('PropertyType')
+        self._configurations = self._distinct_values('Configurations')
+        
+        # Precompute total prices at the smallest and largest unit sizes
+        price_per_sqft = pd.to_numeric(self.df['PricePerSqft'], errors='coerce').to_numpy(dtype=float)
+        self._price_min = price_per_sqft * pd.to_numeric(self.df['MinSizeSqft'], errors='coerce').to_numpy(dtype=float)
+        self._price_max = price_per_sqft * pd.to_numeric(self.df['MaxSizeSqft'], errors='coerce').to_numpy(dtype=float)
+        
+        self._price_range = {
+            "min": self._nan_reduce(np.nanmin, self._price_min),
+            "max": self._nan_reduce(np.nanmax, self._price_max)
+        }
+        
+        # Sort order of the minimum total price so budget bounds resolve
+        # to a contiguous slice via binary search
+        self._price_order = np.argsort(self._price_min, kind='stable')
+        self._price_sorted = self._price_min[self._price_order]
+        
+        # Inverted indexes from lowercased area name (and each word in it)
+        # to row positions, so area lookups skip the substring scan
+        area_groups = self.df.groupby(self.df['Area'].astype(str).str.lower()).indices
+        self._area_index = {k: np.asarray(v, dtype=np.int32) for k, v in area_groups.items()}
+        token_rows = {}
+        for name, rows in self._area_index.items():
+            for token in name.split():
+                token_rows.setdefault(token, []).append(rows)
+        self._area_token_index = {k: np.unique(np.concatenate(v)) for k, v in token_rows.items()}
+    
+    @staticmethod
+    def _nan_reduce(func, values: np.ndarray) -> float:
+        """Apply a NaN-ignoring reduction, falling back to 0 for empty or all-NaN input"""
+        if np.isnan(values).all():
+            return 0
+        return float(func(values))
+    
+    def _area_rows(self, area: str) -> np.ndarray:
+        """
+        Get row positions for an area, preferring the exact and single-word indexes
+        
+        Args:
+            area: Area name as typed by the user
+            
+        Returns:
+            Array of row positions whose area matches
+        """
+        key = area.strip().lower()
+        rows = self._area_index.get(key)
+        if rows is None:
+            rows = self._area_token_index.get(key)
+        if rows is None:
+            # Fall back to a substring scan for partial names
+            mask = self.df['Area'].str.contains(area, case=False, na=False, regex=False)
+            rows = np.flatnonzero(mask.to_numpy())
+        return rows
+    
+    def _budget_rows(self, min_budget: Optional[float] = None,
+                     max_budget: Optional[float] = None) -> np.ndarray:
+        """
+        Get row positions whose minimum total price lies within the budget
+        
+        Args:
+            min_budget: Optional lower bound (inclusive)
+            max_budget: Optional upper bound (inclusive)
+            
+        Returns:
+            Array of row positions, in ascending price order
+        """
+        lo = np.searchsorted(self._price_sorted, min_budget, 'left') if min_budget else 0
+        # NaN prices sort last, so an unbounded slice must stop before them
+        hi = (np.searchsorted(self._price_sorted, max_budget, 'right') if max_budget
+              else np.searchsorted(self._price_sorted, np.inf, 'right'))
+        return self._price_order[lo:hi]
+    
+    def _budget_mask(self, min_budget: Optional[float] = None,
+                     max_budget: Optional[float] = None) -> np.ndarray:
+        """Get a boolean row mask for a budget range"""
+        mask = np.zeros(len(self.df), dtype=bool)
+        mask[self._budget_rows(min_budget, max_budget)] = True
+        return mask
+    
+    def _distinct_values(self, col: str) -> List[str]:
+        """Get the distinct values of a column, reading categories directly for categoricals"""
+        series = self.df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series.cat.categories.tolist()
+        return series.unique().tolist()
+        
     def search_properties(self, 
                          area: Optional[str] = None,
                          property_type: Optional[str] = None, 
@@ -67,83 +161,116 @@ class PropertyRecommendationTools:
             - Dictionary of feedback on which criteria were problematic
             - Boolean indicating if these are exact matches (True) or relaxed matches (False)
         """
-        try:
-            # Store the original criteria for feedback
-            original_criteria = {
-                'area': area,
-                'property_type': property_type,
-                'min_budget': min_budget,
-                'max_budget': max_budget,
-                'configurations': configurations,
-                'possession_date': possession_date,
-                'min_size': min_size,
-                'max_size': max_size
-            }
-            
-            # Make a copy of the DataFrame for filtering
-            filtered_df = self.df.copy()
-            
-            # Apply each filter separately and track the count after each filter
-            # This helps identify which criteria are too restrictive
-            filter_counts = {'initial': len(filtered_df)}
-            
-            # Area filter
-            if area:
-                filtered_df = filtered_df[filtered_df['Area'].str.contains(area, case=False, na=False)]
-                filter_counts['area'] = len(filtered_df)
-            
-            # Property type filter
-            if property_type:
-                filtered_df = filtered_df[filtered_df['PropertyType'].str.contains(property_type, case=False, na=False)]
-                filter_counts['property_type'] = len(filtered_df)
-            
-            # Budget filters
-            if min_budget and 'PricePersqft' in filtered_df.columns and 'MinSizeSqft' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['PricePerSqft'] * filtered_df['MinSizeSqft'] >= min_budget]
-                filter_counts['min_budget'] = len(filtered_df)
-            
-            if max_budget and 'PricePersqft' in filtered_df.columns and 'MinSizeSqft' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['PricePerSqft'] * filtered_df['MinSizeSqft'] <= max_budget]
-                filter_counts['max_budget'] = len(filtered_df)
-            
-            # Configuration filter
-            if configurations:
-                filtered_df = filtered_df[filtered_df['Configurations'].str.contains(configurations, case=False, na=False)]
-                filter_counts['configurations'] = len(filtered_df)
-            
-            # Possession date filter
-            if possession_date:
-                filtered_df = filtered_df[filtered_df['PossessionDate'].str.contains(possession_date, case=False, na=False)]
-                filter_counts['possession_date'] = len(filtered_df)
-            
-            # Size filters
-            if min_size and 'MinSizeSqft' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['MinSizeSqft'] >= min_size]
-                filter_counts['min_size'] = len(filtered_df)
-            
-            if max_size and 'MaxSizeSqft' in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df['MaxSizeSqft'] <= max_size]
-                filter_counts['max_size'] = len(filtered_df)
-            
-            # Get top results (limit to 5 for readability)
-            results = filtered_df.head(5).to_dict('records')
-            
-            # Analyze which criteria might be too restrictive
-            feedback = self._analyze_filter_results(filter_counts, original_criteria)
-            
-            if not results:
-                # If no exact matches, use alternative search strategies
-                return self._alternative_search(area, property_type, min_budget, max_budget, configurations, 
-                                              possession_date, min_size, max_size, filter_counts)
+        for name, value in (('min_budget', min_budget), ('max_budget', max_budget),
+                            ('min_size', min_size), ('max_size', max_size)):
+            if value is not None and value < 0:
+                raise ValueError(f"{name} must be non-negative, got {value}")
+        
+        # Store the original criteria for feedback
+        original_criteria = {
+            'area': area,
+            'property_type': property_type,
+            'min_budget': min_budget,
+            'max_budget': max_budget,
+            'configurations': configurations,
+            'possession_date': possession_date,
+            'min_size': min_size,
+            'max_size': max_size
+        }
+        
+        # Budget-only queries resolve directly from the sorted price index
+        if (min_budget or max_budget) and not (area or property_type or configurations or
+                                               possession_date or min_size or max_size):
+            rows = self._budget_rows(min_budget, max_budget)
+            filter_counts = {'initial': len(self.df)}
+            if min_budget:
+                filter_counts['min_budget'] = len(self._budget_rows(min_budget, None))
+            if max_budget:
+                filter_counts['max_budget'] = len(rows)
+            results = self.df.iloc[np.sort(rows)[:5]].to_dict('records')
+        else:
+            results, filter_counts = self._filter_properties(area, property_type, min_budget, max_budget,
+                                                             configurations, possession_date, min_size, max_size)
+        
+        # Analyze which criteria might be too restrictive
+        feedback = self._analyze_filter_results(filter_counts, original_criteria)
+        
+        if not results:
+            # If no exact matches, use alternative search strategies
+            return self._alternative_search(area, property_type, min_budget, max_budget, configurations, 
+                                          possession_date, min_size, max_size, filter_counts)
+        
+        # Format results for better readability
+        formatted_results = self._format_property_results(results)
             
-            # Format results for better readability
-            formatted_results = self._format_property_results(results)
-                
-            return formatted_results, feedback, True
-        except Exception as e:
-            print(f"Error in search_properties: {e}")
-            # Return an empty list if there's an error
-            return [], {"error": str(e)}, False
+        return formatted_results, feedback, True
+    
+    def _filter_properties(self, area, property_type, min_budget, max_budget,
+                           configurations, possession_date, min_size, max_size) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        Apply each active filter in turn as a packed row bitmask over the dataset.
+        
+        Returns:
+            Tuple containing:
+            - Top matching property records (up to 5)
+            - Dictionary with the number of matches remaining after each filter
+        """
+        df = self.df
+        predicates = []
+        
+        if area:
+            predicates.append(('area', lambda: df['Area'].str.contains(area, case=False, na=False, regex=False)))
+        if property_type:
+            predicates.append(('property_type', lambda: df['PropertyType'].str.contains(property_type, case=False, na=False, regex=False)))
+        if min_budget:
+            predicates.append(('min_budget', lambda: self._budget_mask(min_budget, None)))
+        if max_budget:
+            predicates.append(('max_budget', lambda: self._budget_mask(None, max_budget)))
+        if configurations:
+            predicates.append(('configurations', lambda: df['Configurations'].str.contains(configurations, case=False, na=False, regex=False)))
+        if possession_date:
+            predicates.append(('possession_date', lambda: df['PossessionDate'].str.contains(possession_date, case=False, na=False, regex=False)))
+        if min_size:
+            predicates.append(('min_size', lambda: df['MinSizeSqft'] >= min_size))
+        if max_size:
+            predicates.append(('max_size', lambda: df['MaxSizeSqft'] <= max_size))
+        
+        # Apply each filter separately and track the count after each filter
+        # This helps identify which criteria are too restrictive
+        count = len(df)
+        filter_counts = {'initial': count}
+        survivors = self._pack_mask(np.ones(count, dtype=bool))
+        
+        for name, predicate in predicates:
+            # Once nothing survives, later filters cannot change the outcome
+            if count:
+                survivors &= self._pack_mask(np.asarray(predicate(), dtype=bool))
+                count = self._popcount(survivors)
+            filter_counts[name] = count
+        
+        # Get top results (limit to 5 for readability)
+        results = df.iloc[self._first_rows(survivors, 5)].to_dict('records')
+        
+        return results, filter_counts
+    
+    def _pack_mask(self, mask: np.ndarray) -> np.ndarray:
+        """Pack a boolean row mask into uint64 words, 64 rows per word"""
+        packed = np.zeros(-(-len(mask) // 64) * 8, dtype=np.uint8)
+        packed[:-(-len(mask) // 8)] = np.packbits(mask)
+        return packed.view(np.uint64)
+    
+    @staticmethod
+    def _popcount(words: np.ndarray) -> int:
+        """Count the set bits in a packed row mask"""
+        return int(_POPCOUNT_TABLE[words.view(np.uint8)].sum(dtype=np.int64))
+    
+    @staticmethod
+    def _first_rows(words: np.ndarray, k: int) -> np.ndarray:
+        """Get the positions of the first k set bits in a packed row mask"""
+        packed = words.view(np.uint8)
+        # Only unpack the bytes up to the one holding the k-th survivor
+        stop = int(np.searchsorted(np.cumsum(_POPCOUNT_TABLE[packed]), k)) + 1
+        return np.flatnonzero(np.unpackbits(packed[:stop]))[:k]
     
     def _analyze_filter_results(self, filter_counts: Dict[str, int], 
                                original_criteria: Dict[str, Any]) -> Dict[str, str]:
@@ -169,18 +296,12 @@ class PropertyRecommendationTools:
                 smallest_count = count
                 most_restrictive = criterion
         
-        # Generate specific feedback for each criterion
+        # Generate specific feedback for each criterion, tracking the count
+        # of the previous filter as we walk the (ordered) counts
+        prev_count = initial_count
         for criterion, count in filter_counts.items():
             if criterion == 'initial':
                 continue
-                
-            prev_count = initial_count
-            # Find the previous filter to calculate drop percentage
-            prev_keys = list(filter_counts.keys())
-            current_index = prev_keys.index(criterion)
-            if current_index > 0:
-                prev_key = prev_keys[current_index - 1]
-                prev_count = filter_counts[prev_key]
             
             # Calculate the percentage drop
             if prev_count > 0:
@@ -195,6 +316,8 @@ class PropertyRecommendationTools:
                 feedback[criterion] = f"somewhat restrictive (eliminated {drop_percentage:.1f}% of options)"
             elif drop_percentage > 20:
                 feedback[criterion] = f"slightly restrictive (eliminated {drop_percentage:.1f}% of options)"
+            
+            prev_count = count
         
         # Add a note about the most restrictive criterion
         if most_restrictive and smallest_count == 0:
@@ -219,7 +342,7 @@ class PropertyRecommendationTools:
         
         # Strategy 1: If area filter exists and has matches, show properties just from that area
         if area and filter_counts.get('area', 0) > 0:
-            area_df = self.df[self.df['Area'].str.contains(area, case=False, na=False)]
+            area_df = self.df.iloc[self._area_rows(area)]
             if len(area_df) > 0:
                 # Get a diverse sample of properties from this area
                 area_results = self._get_diverse_sample(area_df, 5)
@@ -238,39 +361,29 @@ class PropertyRecommendationTools:
                 return formatted_results, feedback, False
                 
         # Strategy 2: Relax budget constraints by 20%
-        relaxed_min_budget = min_budget * 0.8 if min_budget else None
-        relaxed_max_budget = max_budget * 1.2 if max_budget else None
-        
-        relaxed_results, relaxed_feedback, _ = self.search_properties(
-            area=area,
-            property_type=property_type,
-            min_budget=relaxed_min_budget,
-            max_budget=relaxed_max_budget,
-            configurations=configurations,
-            possession_date=possession_date,
-            min_size=min_size,
-            max_size=max_size
-        )
-        
-        if relaxed_results:
-            feedback = {
-                "strategy": "relaxed_budget",
-                "message": "Found properties by relaxing your budget constraints by 20%."
-            }
-            return relaxed_results, feedback, False
+        if min_budget or max_budget:
+            relaxed_min_budget = min_budget * 0.8 if min_budget else None
+            relaxed_max_budget = max_budget * 1.2 if max_budget else None
+            
+            relaxed_results, _ = self._filter_properties(
+                area, property_type, relaxed_min_budget, relaxed_max_budget,
+                configurations, possession_date, min_size, max_size
+            )
+            
+            if relaxed_results:
+                feedback = {
+                    "strategy": "relaxed_budget",
+                    "message": "Found properties by relaxing your budget constraints by 20%."
+                }
+                return self._format_property_results(relaxed_results), feedback, False
             
         # Strategy 3: If we have configuration but no matches, relax that
-        if configurations and not relaxed_results:
+        if configurations:
             # For example, if they asked for 4BHK, we might also show 3BHK
-            config_relaxed_results, _, _ = self.search_properties(
-                area=area,
-                property_type=property_type,
-                min_budget=min_budget,
-                max_budget=max_budget,
-                configurations=None,  # Remove configuration constraint
-                possession_date=possession_date,
-                min_size=min_size,
-                max_size=max_size
+            config_relaxed_results, _ = self._filter_properties(
+                area, property_type, min_budget, max_budget,
+                None,  # Remove configuration constraint
+                possession_date, min_size, max_size
             )
             
             if config_relaxed_results:
@@ -278,7 +391,7 @@ class PropertyRecommendationTools:
                     "strategy": "relaxed_configuration",
                     "message": f"Found properties by relaxing your {configurations} requirement."
                 }
-                return config_relaxed_results, feedback, False
+                return self._format_property_results(config_relaxed_results), feedback, False
         
         # Strategy 4: Last resort - show a random sample of properties
         sample_results = self._get_diverse_sample(self.df, 5)
@@ -400,44 +513,16 @@ class PropertyRecommendationTools:
     
     def get_unique_areas(self) -> List[str]:
         """Get list of all unique areas in the dataset"""
-        try:
-            return self.df['Area'].unique().tolist()
-        except Exception as e:
-            print(f"Error in get_unique_areas: {e}")
-            return []
+        return list(self._unique_areas)
     
     def get_property_types(self) -> List[str]:
         """Get list of all property types"""
-        try:
-            return self.df['PropertyType'].unique().tolist()
-        except Exception as e:
-            print(f"Error in get_property_types: {e}")
-            return []
+        return list(self._property_types)
     
     def get_configurations(self) -> List[str]:
         """Get list of all BHK configurations"""
-        try:
-            return self.df['Configurations'].unique().tolist()
-        except Exception as e:
-            print(f"Error in get_configurations: {e}")
-            return []
+        return list(self._configurations)
     
     def get_price_range(self) -> Dict[str, float]:
         """Get min and max property prices"""
-        try:
-            if 'PricePersqft' in self.df.columns and 'MinSizeSqft' in self.df.columns and 'MaxSizeSqft' in self.df.columns:
-                min_price = (self.df['PricePerSqft'] * self.df['MinSizeSqft']).min()
-                max_price = (self.df['PricePerSqft'] * self.df['MaxSizeSqft']).max()
-                
-                # Handle NaN values
-                if pd.isna(min_price):
-                    min_price = 0
-                if pd.isna(max_price):
-                    max_price = 0
-                    
-                return {"min": min_price, "max": max_price}
-            else:
-                return {"min": 0, "max": 0}
-        except Exception as e:
-            print(f"Error in get_price_range: {e}")
-            return {"min": 0, "max": 0}
\ No newline at end of file
+        return self._price_range
\ No newline at end of file
@@ -1,9 +1,224 @@
 # Fixed utils/property_tools_sql.py - Complete merged version
+import logging
 import sqlite3
+import threading
+from functools import lru_cache
+from itertools import islice
 from typing import List, Dict, Any, Tuple, Optional
 import os
+import random
 import re
 from datetime import datetime
+from pathlib import Path
+
+from utils.db_setup import ensure_properties_flat, refresh_properties_flat, store_user_preferences
+
+logger = logging.getLogger(__name__)
+
+# Number of prepared statements each pooled connection keeps cached
+STATEMENT_CACHE_SIZE = 256
+
+# Tuning applied to every pooled connection: 64 MB page cache, 256 MB of
+# memory-mapped I/O and in-memory temp tables for sorts and GROUP BYs
+_READ_PRAGMAS = """
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-65536;
+"""
+
+# Additional settings for the read-write connection; WAL lets readers
+# proceed while preferences are being written
+_WRITE_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA foreign_keys=OFF;
+""" + _READ_PRAGMAS
+
+# Columns selected by every property query, and their positions in a row
+_PROPERTY_COLUMNS = """
+    p.id, p.project_name, p.property_type, p.area, p.possession_date,
+    p.min_size_sqft, p.max_size_sqft, p.price_per_sqft,
+    p.min_total_price, p.max_total_price, p.configurations
+"""
+(_ID, _PROJECT_NAME, _PROPERTY_TYPE, _AREA, _POSSESSION_DATE,
+ _MIN_SIZE, _MAX_SIZE, _PRICE_PER_SQFT,
+ _MIN_TOTAL, _MAX_TOTAL, _CONFIGURATIONS) = range(11)
+
+# Prices from one crore up are shown in crores, below that in lakhs.
+# _PRICE_FMTS is indexed by (min >= crore) * 2 + (max >= crore) and holds
+# each tier's template with the divisors for the min and max price
+_LAKH = 100_000
+_CRORE = 10_000_000
+_PRICE_FMTS = (
+    ("₹{:.2f} - ₹{:.2f} Lakhs", _LAKH, _LAKH),
+    ("₹{:.2f} Lakhs - ₹{:.2f} Cr", _LAKH, _CRORE),
+    ("₹{:.2f} - ₹{:.2f} Cr", _CRORE, _CRORE),
+    ("₹{:.2f} - ₹{:.2f} Cr", _CRORE, _CRORE),
+)
+
+# Base feedback for each search strategy; copied with dict() before adding
+# per-search details
+_FEEDBACK_EXACT = {"strategy": "exact_match"}
+_FEEDBACK_AREA_ONLY = {"strategy": "area_only"}
+_FEEDBACK_DIVERSE = {"strategy": "diverse_sample"}
+_DIVERSE_SAMPLE_MESSAGE = "Showing a diverse sample of properties. Please refine your criteria for more specific matches."
+
+# Possession preferences meaning "already available"
+_READY_TO_MOVE = frozenset(['ready', 'ready to move', 'ready to move in'])
+
+# A possession preference given as a bare year
+_YEAR_RE = re.compile(r'^\d{4}$')
+
+# Word tokens of a free-text filter, as the FTS5 tokenizer would split them
+_TOKEN_RE = re.compile(r'\w+')
+
+@lru_cache(maxsize=64)
+def _placeholders(n: int) -> str:
+    """Get a comma-separated list of n '?' placeholders for an IN clause"""
+    return ','.join(['?'] * n)
+
+def _fts_phrase(text: str) -> Optional[str]:
+    """
+    Build an FTS5 phrase query matching the words of text in order
+    
+    Args:
+        text: Free-text filter value
+        
+    Returns:
+        Optional[str]: Quoted phrase for MATCH, or None if text has no words
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    return '"' + ' '.join(tokens) + '"'
+
+# A bedroom-count configuration such as '3BHK', '3 BHK' or '3 Bedroom'
+_BHK_RE = re.compile(r'^\s*(\d+)\s*(?:BHK|Bedroom)\s*$', re.I)
+
+def _bhk_expansion(bedrooms: str) -> Tuple[str, ...]:
+    """Get the alternative formats of an n-bedroom configuration"""
+    expansion = (f"{bedrooms}BHK", f"{bedrooms} BHK", f"{bedrooms} Bedroom")
+    # If 3BHK is requested, also include 2BHK options
+    if bedrooms == '3':
+        expansion += _bhk_expansion('2')
+    return expansion
+
+_EXPANSIONS = {str(n): _bhk_expansion(str(n)) for n in range(1, 11)}
+
+@lru_cache(maxsize=256)
+def _expand_configurations(configurations: str) -> Tuple[str, ...]:
+    """
+    Expand a comma-separated configuration preference into every
+    configuration name that should match it
+    
+    Args:
+        configurations: Configuration preference (e.g., '2BHK, 3BHK')
+        
+    Returns:
+        Tuple of distinct configuration names, requested ones first
+    """
+    expanded_configs = []
+    for config in configurations.split(','):
+        config = config.strip()
+        expanded_configs.append(config)
+        match = _BHK_RE.match(config)
+        if match:
+            bedrooms = match.group(1)
+            expanded_configs.extend(_EXPANSIONS.get(bedrooms) or _bhk_expansion(bedrooms))
+    return tuple(dict.fromkeys(expanded_configs))
+
+# Bits for the active search filters passed to _build_search_sql
+_F_AREA = 1
+_F_TYPE = 2
+_F_MIN_BUDGET = 4
+_F_MAX_BUDGET = 8
+_F_CONFIGS = 16
+_F_MIN_SIZE = 32
+_F_MAX_SIZE = 64
+
+# Possession filters by the form the preference was given in
+_POSSESSION_SQL = {
+    'ready': " AND (p.possession_ready = 1 OR p.possession_year = ?)",
+    'year': " AND p.possession_year = ?",
+    'date': " AND p.possession_date = ?",
+    'fts': """
+    AND p.id IN (
+        SELECT rowid FROM properties_fts
+        WHERE properties_fts MATCH ?
+    )""",
+    'like': " AND p.possession_date LIKE ?",
+}
+
+@lru_cache(maxsize=512)
+def _build_search_sql(mask: int, n_configs: int, possession_mode: Optional[str]) -> str:
+    """
+    Generate the ID query for a combination of active search filters
+    
+    Placeholders for the filters come first, in the order area, property
+    type, min budget, max budget, configurations, possession date, min size
+    and max size, followed by those of the ORDER BY: area, property type,
+    configurations and the target budget when both budgets are given, and
+    finally the LIMIT.
+    
+    Args:
+        mask: Bitwise OR of the _F_* flags for the active filters
+        n_configs: Number of expanded configuration names
+        possession_mode: Key into _POSSESSION_SQL, or None
+        
+    Returns:
+        str: SQL selecting matching property IDs in ranked order
+    """
+    query = """
+    SELECT p.id
+    FROM properties_flat p
+    WHERE 1=1
+    """
+    if mask & _F_AREA:
+        query += " AND p.area = ?"
+    if mask & _F_TYPE:
+        query += " AND p.property_type = ?"
+    if mask & _F_MIN_BUDGET:
+        query += " AND p.max_total_price >= ?"
+    if mask & _F_MAX_BUDGET:
+        query += " AND p.min_total_price <= ?"
+    if mask & _F_CONFIGS:
+        query += f"""
+    AND p.id IN (
+        SELECT property_id FROM property_configurations_idx
+        WHERE config_name IN ({_placeholders(n_configs)})
+    )"""
+    if possession_mode:
+        query += _POSSESSION_SQL[possession_mode]
+    if mask & _F_MIN_SIZE:
+        query += " AND p.max_size_sqft >= ?"
+    if mask & _F_MAX_SIZE:
+        query += " AND p.min_size_sqft <= ?"
+    
+    # Order by closest match to preferences
+    order_clause = []
+    if mask & _F_AREA:
+        order_clause.append("p.area = ? DESC")
+    if mask & _F_TYPE:
+        order_clause.append("p.property_type = ? DESC")
+    if mask & _F_CONFIGS:
+        # Order by the number of matching configurations
+        order_clause.append(f"""
+        (SELECT COUNT(*) FROM property_configurations_idx ci
+         WHERE ci.property_id = p.id AND ci.config_name IN ({_placeholders(n_configs)})) DESC
+        """)
+    
+    # Add a tie-breaker sort by total price if budget specified
+    budget_bits = mask & (_F_MIN_BUDGET | _F_MAX_BUDGET)
+    if budget_bits == _F_MIN_BUDGET | _F_MAX_BUDGET:
+        order_clause.append("ABS((p.min_total_price + p.max_total_price) / 2 - ?) ASC")
+    elif budget_bits == _F_MIN_BUDGET:
+        order_clause.append("p.min_total_price ASC")
+    elif budget_bits == _F_MAX_BUDGET:
+        order_clause.append("p.max_total_price DESC")
+    
+    # Break remaining ties by ID so results don't depend on which index is used
+    order_clause.append("p.id")
+    return query + " ORDER BY " + ", ".join(order_clause) + " LIMIT ?"
 
 class PropertyRecommendationToolsSQL:
     """Tools for recommending properties using a SQL database instead of pandas"""
@@ -20,20 +235,55 @@ class PropertyRecommendationToolsSQL:
         # Verify database exists
         if not os.path.exists(db_path):
             raise FileNotFoundError(f"Database not found: {db_path}")
+        
+        # One long-lived connection per thread, so SQLite's page cache and
+        # prepared statements survive across calls
+        self._local = threading.local()
+        
+        # Property data only changes on re-import, so the denormalized
+        # search tables are only rebuilt when they are missing or stale,
+        # and the lookup lists are cached until the tables are rebuilt
+        self._metadata_cache: Optional[Dict[str, Any]] = None
+        self._metadata_signature: Optional[str] = None
+        self._metadata_lock = threading.Lock()
+        self._area_cache: Dict[Tuple[str, int], Tuple[Dict[str, Any], ...]] = {}
+        ensure_properties_flat(self.get_connection())
 
-    def get_connection(self):
+    def get_connection(self, read_only: bool = False):
         """
-        Get a connection to the SQLite database
+        Get this thread's pooled connection to the SQLite database,
+        opening it on first use
+        
+        Args:
+            read_only: Use a read-only connection (for queries that never write)
         
         Returns:
             sqlite3.Connection: A connection to the database
         """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            return conn
-        except Exception as e:
-            raise Exception(f"Error connecting to database: {str(e)}")
+        attr = 'ro_conn' if read_only else 'conn'
+        conn = getattr(self._local, attr, None)
+        if conn is None:
+            try:
+                if read_only:
+                    conn = sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                           cached_statements=STATEMENT_CACHE_SIZE)
+                    conn.executescript(_READ_PRAGMAS)
+                else:
+                    conn = sqlite3.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
+                    conn.executescript(_WRITE_PRAGMAS)
+            except Exception as e:
+                raise Exception(f"Error connecting to database: {str(e)}")
+            setattr(self._local, attr, conn)
+        return conn
+
+    def close(self):
+        """Close this thread's pooled connections, letting SQLite refresh its statistics first"""
+        for attr in ('conn', 'ro_conn'):
+            conn = getattr(self._local, attr, None)
+            if conn is not None:
+                conn.execute("PRAGMA optimize")
+                conn.close()
+                setattr(self._local, attr, None)
 
     def search_properties(
         self,
@@ -72,7 +322,6 @@ class PropertyRecommendationToolsSQL:
         # Store user preferences if session_id is provided
         if session_id:
             try:
-                from utils.db_setup import store_user_preferences
                 store_user_preferences(
                     session_id=session_id,
                     area=area,
@@ -83,224 +332,142 @@ class PropertyRecommendationToolsSQL:
                     possession_date=possession_date,
                     min_size=min_size,
                     max_size=max_size,
-                    db_path=self.db_path
+                    db_path=self.db_path,
+                    conn=self.get_connection()
                 )
             except Exception as e:
-                print(f"Error storing preferences: {e}")
+                logger.debug("Error storing preferences: %s", e)
         
         # Handle single budget value - if only max_budget is provided, set min_budget to 0
         if max_budget and not min_budget:
             min_budget = 0
-            print(f"Only max budget provided: filtering properties below ₹{max_budget:,.0f}")
+            logger.info("Only max budget provided: filtering properties below ₹%.0f", max_budget)
         
         # If only area is specified, increase the limit to show more properties
-        if area and not (property_type or min_budget or max_budget or configurations or 
-                         possession_date or min_size or max_size):
+        area_only = area and not (property_type or min_budget or max_budget or configurations or
+                                  possession_date or min_size or max_size)
+        if area_only:
             limit = max(limit, 15)  # Show at least 15 properties for area-only queries
         
         try:
+            # The most common search; answer it from the per-area cache
+            if area_only:
+                area_properties = self._area_only(area, limit)
+                if len(area_properties) >= 2:
+                    feedback = dict(_FEEDBACK_EXACT, exact_match_conditions=["area"])
+                    return [dict(prop) for prop in area_properties], feedback, True
+            
             # Connect to database
             conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Build query
-            query = """
-            SELECT DISTINCT 
-                p.id, p.project_name, p.property_type, p.area, p.possession_date,
-                p.min_size_sqft, p.max_size_sqft, p.price_per_sqft,
-                (p.min_size_sqft * p.price_per_sqft) as min_total_price,
-                (p.max_size_sqft * p.price_per_sqft) as max_total_price,
-                GROUP_CONCAT(c.name, ', ') as configurations
-            FROM properties p
-            LEFT JOIN property_configurations pc ON p.id = pc.property_id
-            LEFT JOIN configurations c ON pc.configuration_id = c.id
-            WHERE 1=1
-            """
             
+            # Work out which filters are active; the SQL for each combination
+            # is generated once by _build_search_sql and reused, so params
+            # are collected in the order its placeholders appear
+            mask = 0
+            possession_mode = None
+            n_configs = 0
             params = []
             exact_match_conditions = []
             
             # Add conditions based on preferences
             if area:
-                query += " AND p.area = ?"
+                mask |= _F_AREA
                 params.append(area)
                 exact_match_conditions.append("area")
             
             if property_type:
-                query += " AND p.property_type = ?"
+                mask |= _F_TYPE
                 params.append(property_type)
                 exact_match_conditions.append("property_type")
             
             if min_budget:
-                query += " AND (p.max_size_sqft * p.price_per_sqft) >= ?"
+                mask |= _F_MIN_BUDGET
                 params.append(min_budget)
                 exact_match_conditions.append("min_budget")
             
             if max_budget:
-                query += " AND (p.min_size_sqft * p.price_per_sqft) <= ?"
+                mask |= _F_MAX_BUDGET
                 params.append(max_budget)
                 exact_match_conditions.append("max_budget")
             
             if configurations:
                 # Extract and expand configurations for more intelligent matching
-                config_list = [c.strip() for c in configurations.split(',')]
-                expanded_configs = []
-        
-                for config in config_list:
-                    expanded_configs.append(config)
-                    # If it's a BHK configuration, add similar formats and alternative options
-                    if 'BHK' in config:
-                        # Extract the number of bedrooms
-                        bhk_number = config.replace('BHK', '').strip()
-                        if bhk_number.isdigit():
-                            # Add alternative formats of the same configuration
-                            expanded_configs.append(f"{bhk_number} BHK")
-                            expanded_configs.append(f"{bhk_number} Bedroom")
-                            
-                            # If 3BHK is requested, also include 2BHK options
-                            if bhk_number == '3':
-                                expanded_configs.append('2BHK')
-                                expanded_configs.append('2 BHK')
-                                expanded_configs.append('2 Bedroom')
+                expanded_configs = _expand_configurations(configurations)
         
                 # Add configuration filter with expanded options
-                query += f"""
-                AND EXISTS (
-                    SELECT 1 FROM property_configurations pc2 
-                    JOIN configurations c2 ON pc2.configuration_id = c2.id 
-                    WHERE pc2.property_id = p.id AND c2.name IN ({','.join(['?'] * len(expanded_configs))})
-                )
-                """
+                mask |= _F_CONFIGS
+                n_configs = len(expanded_configs)
                 params.extend(expanded_configs)
                 exact_match_conditions.append("configurations")
             
             # Improved possession date handling
             if possession_date:
-                if possession_date.lower() in ['ready', 'ready to move', 'ready to move in']:
+                if possession_date.lower() in _READY_TO_MOVE:
                     # Get current date for "ready to move" properties
                     current_date = datetime.now()
                     
                     # Include properties that are ready or will be ready this year
-                    query += " AND (p.possession_date LIKE ? OR p.possession_date LIKE ? OR p.possession_date LIKE ?)"
-                    params.extend(['%ready%', '%Ready%', f"%{current_date.year}%"])
-                    print(f"Filtering for ready to move properties or available in {current_date.year}")
-                    
-                    exact_match_conditions.append("possession_date")
-                elif re.match(r'^\d{4}$', possession_date):
+                    possession_mode = 'ready'
+                    params.append(current_date.year)
+                    logger.info("Filtering for ready to move properties or available in %d", current_date.year)
+                elif _YEAR_RE.match(possession_date):
                     # If just a year is provided
-                    query += " AND p.possession_date LIKE ?"
-                    params.append(f"%{possession_date}%")
-                    exact_match_conditions.append("possession_date")
+                    possession_mode = 'year'
+                    params.append(int(possession_date))
                 else:
                     # Try to parse as a date
                     try:
                         date_obj = datetime.strptime(possession_date, "%m/%d/%Y")
-                        query += " AND p.possession_date = ?"
+                        possession_mode = 'date'
                         params.append(date_obj.strftime("%m/%d/%Y"))
-                        exact_match_conditions.append("possession_date")
                     except ValueError:
-                        # If parsing fails, use simple text matching
-                        query += " AND p.possession_date LIKE ?"
-                        params.append(f"%{possession_date}%")
-                        exact_match_conditions.append("possession_date")
+                        # If parsing fails, use the full-text index
+                        phrase = _fts_phrase(possession_date)
+                        if phrase:
+                            possession_mode = 'fts'
+                            params.append(f"possession_date : {phrase}")
+                        else:
+                            possession_mode = 'like'
+                            params.append(f"%{possession_date}%")
+                exact_match_conditions.append("possession_date")
             
             if min_size:
-                query += " AND p.max_size_sqft >= ?"
+                mask |= _F_MIN_SIZE
                 params.append(min_size)
                 exact_match_conditions.append("min_size")
             
             if max_size:
-                query += " AND p.min_size_sqft <= ?"
+                mask |= _F_MAX_SIZE
                 params.append(max_size)
                 exact_match_conditions.append("max_size")
             
-            # Group by property
-            query += " GROUP BY p.id"
-            
             # Order by closest match to preferences
-            order_clause = []
-            
             if area:
-                order_clause.append("p.area = ? DESC")
                 params.append(area)
             
             if property_type:
-                order_clause.append("p.property_type = ? DESC")
                 params.append(property_type)
             
             if configurations:
-                # Order by the number of matching configurations
-                order_clause.append(f"""
-                (SELECT COUNT(*) FROM property_configurations pc3
-                 JOIN configurations c3 ON pc3.configuration_id = c3.id
-                 WHERE pc3.property_id = p.id AND c3.name IN ({','.join(['?'] * len(expanded_configs))})) DESC
-                """)
                 params.extend(expanded_configs)
             
-            # Add a tie-breaker sort by total price if budget specified
-            if min_budget or max_budget:
-                if min_budget and max_budget:
-                    target_budget = (min_budget + max_budget) / 2
-                    order_clause.append("ABS((p.min_size_sqft * p.price_per_sqft + p.max_size_sqft * p.price_per_sqft) / 2 - ?) ASC")
-                    params.append(target_budget)
-                elif min_budget:
-                    order_clause.append("(p.min_size_sqft * p.price_per_sqft) ASC")
-                else:
-                    order_clause.append("(p.max_size_sqft * p.price_per_sqft) DESC")
-            
-            # Append order clause if any
-            if order_clause:
-                query += " ORDER BY " + ", ".join(order_clause)
+            if min_budget and max_budget:
+                params.append((min_budget + max_budget) / 2)
             
-            # Add limit
-            query += f" LIMIT {limit}"
+            # Only IDs go through the filter and sort, the display columns
+            # are fetched afterwards for the page of results
+            query = _build_search_sql(mask, n_configs, possession_mode)
+            params.append(int(limit))
             
             # Execute the query
-            cursor.execute(query, params)
-            result_rows = cursor.fetchall()
+            id_rows = conn.execute(query, params).fetchmany(max(limit, 1))
+            result_rows = self._fetch_by_ids(conn, [row[0] for row in id_rows])
             
             # Check if we have an exact match
             exact_match = len(result_rows) > 0 and len(exact_match_conditions) > 0
             
             # Format results
-            properties = []
-            for row in result_rows:
-                # Convert row to dict
-                row_dict = dict(row)
-                
-                # Calculate total prices properly
-                min_total = row_dict['min_size_sqft'] * row_dict['price_per_sqft']
-                max_total = row_dict['max_size_sqft'] * row_dict['price_per_sqft']
-                
-                # Format in lakhs if under 1 crore, otherwise in crores
-                if min_total < 10000000 and max_total < 10000000:
-                    # Both values less than 1 crore, format in lakhs
-                    min_lakhs = min_total / 100000
-                    max_lakhs = max_total / 100000
-                    price_str = f"₹{min_lakhs:.2f} - ₹{max_lakhs:.2f} Lakhs"
-                elif min_total < 10000000:
-                    # Min in lakhs, max in crores
-                    min_lakhs = min_total / 100000
-                    max_crores = max_total / 10000000
-                    price_str = f"₹{min_lakhs:.2f} Lakhs - ₹{max_crores:.2f} Cr"
-                else:
-                    # Both in crores
-                    min_crores = min_total / 10000000
-                    max_crores = max_total / 10000000
-                    price_str = f"₹{min_crores:.2f} - ₹{max_crores:.2f} Cr"
-                
-                # Format property data
-                prop = {
-                    "name": row_dict["project_name"],
-                    "area": row_dict["area"],
-                    "type": row_dict["property_type"],
-                    "configuration": row_dict["configurations"] or "Not specified",
-                    "size": f"{row_dict['min_size_sqft']} - {row_dict['max_size_sqft']} sqft",
-                    "price_per_sqft": f"₹{row_dict['price_per_sqft']:,}",
-                    "approx_total_price": price_str,
-                    "possession_date": row_dict["possession_date"]
-                }
-                properties.append(prop)
+            properties = [self._format_row(row) for row in result_rows]
             
             # If no results or very few, try a relaxed search
             if len(properties) < 2 and len(exact_match_conditions) > 0:
@@ -319,12 +486,11 @@ class PropertyRecommendationToolsSQL:
                 # If original search returned at least one result, merge with relaxed results
                 if properties:
                     # Add any relaxed results not already in the list (by name)
-                    existing_names = set(p["name"] for p in properties)
-                    for relaxed_prop in relaxed_results:
-                        if relaxed_prop["name"] not in existing_names:
-                            properties.append(relaxed_prop)
-                            if len(properties) >= limit:
-                                break
+                    existing_names = {p["name"] for p in properties}
+                    properties.extend(islice(
+                        (prop for prop in relaxed_results if prop["name"] not in existing_names),
+                        max(limit - len(properties), 1)
+                    ))
                     
                     feedback = {
                         "exact_match_conditions": exact_match_conditions,
@@ -338,10 +504,10 @@ class PropertyRecommendationToolsSQL:
                     exact_match = False
             else:
                 # Regular search feedback
-                feedback = {
-                    "exact_match_conditions": exact_match_conditions,
-                    "strategy": "exact_match" if exact_match else "area_only" if area else "diverse_sample"
-                }
+                feedback = dict(
+                    _FEEDBACK_EXACT if exact_match else _FEEDBACK_AREA_ONLY if area else _FEEDBACK_DIVERSE,
+                    exact_match_conditions=exact_match_conditions
+                )
                 
                 # Add adjustment suggestions
                 if not exact_match:
@@ -357,13 +523,93 @@ class PropertyRecommendationToolsSQL:
                             elif "configurations" in conditions_without_area:
                                 feedback["adjustment_needed"] = "configurations"
             
-            conn.close()
             return properties, feedback, exact_match
         
         except Exception as e:
-            print(f"Error in search_properties: {e}")
+            logger.exception("Error in search_properties")
             return [], {"error": str(e)}, False
     
+    def _area_only(self, area: str, limit: int) -> Tuple[Dict[str, Any], ...]:
+        """
+        Get the formatted properties in an area, cached until the database changes
+        
+        Args:
+            area: Location/area in Hyderabad
+            limit: Maximum number of properties to return
+            
+        Returns:
+            Tuple of formatted properties in ID order; empty if the area has none
+        """
+        # Checks the database hasn't changed, dropping stale area results
+        self._load_metadata()
+        
+        key = (area, limit)
+        properties = self._area_cache.get(key)
+        if properties is None:
+            rows = self.get_connection(read_only=True).execute(f"""
+            SELECT {_PROPERTY_COLUMNS}
+            FROM properties_flat p
+            WHERE p.area = ?
+            ORDER BY p.id
+            LIMIT ?
+            """, [area, limit]).fetchmany(max(limit, 1))
+            properties = tuple(self._format_row(row) for row in rows)
+            # Unknown areas aren't cached so free-text input can't grow the cache
+            if properties:
+                self._area_cache[key] = properties
+        return properties
+    
+    @staticmethod
+    def _fetch_by_ids(conn: sqlite3.Connection, ids: List[int]) -> List[tuple]:
+        """
+        Fetch the display columns for a list of property IDs
+        
+        Args:
+            conn: Open connection to the property database
+            ids: Property IDs in the order they should be returned
+            
+        Returns:
+            List of rows selected with _PROPERTY_COLUMNS, in the order of ids
+        """
+        if not ids:
+            return []
+        rows = conn.execute(f"""
+        SELECT {_PROPERTY_COLUMNS}
+        FROM properties_flat p
+        WHERE p.id IN ({_placeholders(len(ids))})
+        """, ids).fetchmany(len(ids))
+        by_id = {row[_ID]: row for row in rows}
+        return [by_id[property_id] for property_id in ids]
+    
+    @staticmethod
+    def _format_row(row: tuple) -> Dict[str, Any]:
+        """
+        Format a property row for display
+        
+        Args:
+            row: Row selected with _PROPERTY_COLUMNS
+            
+        Returns:
+            Dict: Property details with human-readable size and prices
+        """
+        min_total = row[_MIN_TOTAL]
+        max_total = row[_MAX_TOTAL]
+        
+        # Format in lakhs if under 1 crore, otherwise in crores
+        template, min_unit, max_unit = _PRICE_FMTS[(min_total >= _CRORE) * 2 + (max_total >= _CRORE)]
+        price_str = template.format(min_total / min_unit, max_total / max_unit)
+        
+        return {
+            "name": row[_PROJECT_NAME],
+            "area": row[_AREA],
+            "type": row[_PROPERTY_TYPE],
+            "configuration": row[_CONFIGURATIONS] or "Not specified",
+            "size": f"{row[_MIN_SIZE]} - {row[_MAX_SIZE]} sqft",
+            "price_per_sqft": f"₹{row[_PRICE_PER_SQFT]:,}",
+            "approx_total_price": price_str,
+            "possession_date": row[_POSSESSION_DATE]
+        }
+    
     def relaxed_search(
         self,
         area: Optional[str] = None,
@@ -383,203 +629,131 @@ class PropertyRecommendationToolsSQL:
         try:
             # Connect to database
             conn = self.get_connection()
-            cursor = conn.cursor()
             
             # Strategy 1: Keep area but relax other constraints
             if area:
-                query = """
-                SELECT DISTINCT 
-                    p.id, p.project_name, p.property_type, p.area, p.possession_date,
-                    p.min_size_sqft, p.max_size_sqft, p.price_per_sqft,
-                    (p.min_size_sqft * p.price_per_sqft) as min_total_price,
-                    (p.max_size_sqft * p.price_per_sqft) as max_total_price,
-                    GROUP_CONCAT(c.name, ', ') as configurations
-                FROM properties p
-                LEFT JOIN property_configurations pc ON p.id = pc.property_id
-                LEFT JOIN configurations c ON pc.configuration_id = c.id
-                WHERE p.area = ?
-                GROUP BY p.id
-                LIMIT ?
-                """
-                
-                cursor.execute(query, [area, limit])
-                area_rows = cursor.fetchall()
+                area_properties = self._area_only(area, limit)
                 
-                if area_rows:
-                    properties = []
-                    for row in area_rows:
-                        row_dict = dict(row)
-                        
-                        # Calculate total prices properly
-                        min_total = row_dict['min_size_sqft'] * row_dict['price_per_sqft']
-                        max_total = row_dict['max_size_sqft'] * row_dict['price_per_sqft']
-                        
-                        # Format in lakhs if under 1 crore, otherwise in crores
-                        if min_total < 10000000 and max_total < 10000000:
-                            min_lakhs = min_total / 100000
-                            max_lakhs = max_total / 100000
-                            price_str = f"₹{min_lakhs:.2f} - ₹{max_lakhs:.2f} Lakhs"
-                        elif min_total < 10000000:
-                            min_lakhs = min_total / 100000
-                            max_crores = max_total / 10000000
-                            price_str = f"₹{min_lakhs:.2f} Lakhs - ₹{max_crores:.2f} Cr"
-                        else:
-                            min_crores = min_total / 10000000
-                            max_crores = max_total / 10000000
-                            price_str = f"₹{min_crores:.2f} - ₹{max_crores:.2f} Cr"
-                        
-                        prop = {
-                            "name": row_dict["project_name"],
-                            "area": row_dict["area"],
-                            "type": row_dict["property_type"],
-                            "configuration": row_dict["configurations"] or "Not specified",
-                            "size": f"{row_dict['min_size_sqft']} - {row_dict['max_size_sqft']} sqft",
-                            "price_per_sqft": f"₹{row_dict['price_per_sqft']:,}",
-                            "approx_total_price": price_str,
-                            "possession_date": row_dict["possession_date"]
-                        }
-                        properties.append(prop)
+                if area_properties:
+                    properties = [dict(prop) for prop in area_properties]
                     
-                    feedback = {
-                        "strategy": "area_only",
-                        "relaxed_all_except_area": True
-                    }
+                    feedback = dict(_FEEDBACK_AREA_ONLY, relaxed_all_except_area=True)
                     
-                    conn.close()
                     return properties, feedback
             
-            # Strategy 2: Get a diverse sample
-            query = """
-            SELECT DISTINCT 
-                p.id, p.project_name, p.property_type, p.area, p.possession_date,
-                p.min_size_sqft, p.max_size_sqft, p.price_per_sqft,
-                (p.min_size_sqft * p.price_per_sqft) as min_total_price,
-                (p.max_size_sqft * p.price_per_sqft) as max_total_price,
-                GROUP_CONCAT(c.name, ', ') as configurations
-            FROM properties p
-            LEFT JOIN property_configurations pc ON p.id = pc.property_id
-            LEFT JOIN configurations c ON pc.configuration_id = c.id
-            GROUP BY p.id
-            ORDER BY RANDOM()
-            LIMIT ?
-            """
+            # Strategy 2: Get a diverse sample of randomly drawn IDs
+            property_ids = self._load_metadata()['ids']
+            sample_ids = random.sample(property_ids, min(limit, len(property_ids)))
+            sample_rows = self._fetch_by_ids(conn, sample_ids)
             
-            cursor.execute(query, [limit])
-            sample_rows = cursor.fetchall()
+            properties = [self._format_row(row) for row in sample_rows]
             
-            properties = []
-            for row in sample_rows:
-                row_dict = dict(row)
-                
-                # Calculate total prices properly
-                min_total = row_dict['min_size_sqft'] * row_dict['price_per_sqft']
-                max_total = row_dict['max_size_sqft'] * row_dict['price_per_sqft']
-                    
-                # Format in lakhs if under 1 crore, otherwise in crores
-                if min_total < 10000000 and max_total < 10000000:
-                    min_lakhs = min_total / 100000
-                    max_lakhs = max_total / 100000
-                    price_str = f"₹{min_lakhs:.2f} - ₹{max_lakhs:.2f} Lakhs"
-                elif min_total < 10000000:
-                    min_lakhs = min_total / 100000
-                    max_crores = max_total / 10000000
-                    price_str = f"₹{min_lakhs:.2f} Lakhs - ₹{max_crores:.2f} Cr"
-                else:
-                    min_crores = min_total / 10000000
-                    max_crores = max_total / 10000000
-                    price_str = f"₹{min_crores:.2f} - ₹{max_crores:.2f} Cr"
-                    
-                prop = {
-                    "name": row_dict["project_name"],
-                    "area": row_dict["area"],
-                    "type": row_dict["property_type"],
-                    "configuration": row_dict["configurations"] or "Not specified",
-                    "size": f"{row_dict['min_size_sqft']} - {row_dict['max_size_sqft']} sqft",
-                    "price_per_sqft": f"₹{row_dict['price_per_sqft']:,}",
-                    "approx_total_price": price_str,
-                    "possession_date": row_dict["possession_date"]
-                }
-                properties.append(prop)
-            
-            feedback = {
-                "strategy": "diverse_sample",
-                "relaxed_all": True,
-                "message": "Showing a diverse sample of properties. Please refine your criteria for more specific matches."
-            }
+            feedback = dict(_FEEDBACK_DIVERSE, relaxed_all=True, message=_DIVERSE_SAMPLE_MESSAGE)
             
-            conn.close()
             return properties, feedback
         
         except Exception as e:
-            print(f"Error in relaxed_search: {e}")
+            logger.exception("Error in relaxed_search")
             return [], {"error": str(e)}
     
+    def _load_metadata(self) -> Dict[str, Any]:
+        """
+        Get the cached lookup lists and price range, loading them all in a
+        single query on first use and again whenever the search tables have
+        been rebuilt since, by this or another process; the per-area results
+        are dropped at the same time
+        
+        Returns:
+            Dict with 'areas', 'types', 'configs' and 'ids' lists and a 'price_range' tuple
+        """
+        # The rebuild signature only changes when the property data does, so
+        # preference writes (and WAL checkpoints) leave the caches alone
+        row = self.get_connection(read_only=True).execute(
+            "SELECT source_signature FROM properties_flat_meta").fetchone()
+        signature = row[0] if row else None
+        cache = self._metadata_cache
+        if cache is None or signature != self._metadata_signature:
+            with self._metadata_lock:
+                cache = self._metadata_cache
+                if cache is None or signature != self._metadata_signature:
+                    cache = self._query_metadata()
+                    self._area_cache.clear()
+                    self._metadata_signature = signature
+                    self._metadata_cache = cache
+        return cache
+    
+    def _query_metadata(self) -> Dict[str, Any]:
+        """Load the lookup lists and price range in a single query"""
+        conn = self.get_connection(read_only=True)
+        rows = conn.execute("""
+        SELECT 'area' AS kind, area AS val FROM (SELECT DISTINCT area FROM properties_flat)
+        UNION ALL
+        SELECT 'type', property_type FROM (SELECT DISTINCT property_type FROM properties_flat)
+        UNION ALL
+        SELECT 'cfg', name FROM configurations
+        UNION ALL
+        SELECT 'id', id FROM properties_flat
+        UNION ALL
+        SELECT 'min', MIN(min_total_price) FROM properties_flat
+        UNION ALL
+        SELECT 'max', MAX(max_total_price) FROM properties_flat
+        """).fetchall()
+        
+        # Partition the rows by kind
+        values = {'area': [], 'type': [], 'cfg': [], 'id': [], 'min': [None], 'max': [None]}
+        for kind, val in rows:
+            if kind in ('min', 'max'):
+                values[kind] = [val]
+            else:
+                values[kind].append(val)
+        
+        return {
+            'areas': sorted(values['area']),
+            'types': sorted(values['type']),
+            'configs': sorted(set(values['cfg'])),
+            'ids': values['id'],
+            'price_range': (values['min'][0], values['max'][0])
+        }
+    
+    def refresh(self):
+        """Rebuild the derived search tables and drop the cached lookup lists and area results"""
+        refresh_properties_flat(self.get_connection())
+        with self._metadata_lock:
+            self._metadata_cache = None
+            self._area_cache.clear()
+    
     def get_unique_areas(self) -> List[str]:
         """Get a list of all available areas"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT DISTINCT area FROM properties ORDER BY area")
-            areas = [row['area'] for row in cursor.fetchall()]
-            
-            conn.close()
-            return areas
+            return self._load_metadata()['areas'][:]
         except Exception as e:
-            print(f"Error in get_unique_areas: {e}")
+            logger.exception("Error in get_unique_areas")
             return []
     
     def get_property_types(self) -> List[str]:
         """Get a list of all available property types"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT DISTINCT property_type FROM properties ORDER BY property_type")
-            types = [row['property_type'] for row in cursor.fetchall()]
-            
-            conn.close()
-            return types
+            return self._load_metadata()['types'][:]
         except Exception as e:
-            print(f"Error in get_property_types: {e}")
+            logger.exception("Error in get_property_types")
             return []
     
     def get_configurations(self) -> List[str]:
         """Get a list of all available configurations"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT DISTINCT name FROM configurations ORDER BY name")
-            configs = [row['name'] for row in cursor.fetchall()]
-            
-            conn.close()
-            return configs
+            return self._load_metadata()['configs'][:]
         except Exception as e:
-            print(f"Error in get_configurations: {e}")
+            logger.exception("Error in get_configurations")
             return []
     
     def get_price_range(self) -> Dict[str, float]:
         """Get the minimum and maximum property prices"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-            SELECT 
-                MIN(min_size_sqft * price_per_sqft) as min_price, 
-                MAX(max_size_sqft * price_per_sqft) as max_price
-            FROM properties
-            """)
-            
-            result = cursor.fetchone()
-            
-            conn.close()
-            
+            min_price, max_price = self._load_metadata()['price_range']
             return {
-                "min": result['min_price'],
-                "max": result['max_price']
+                "min": min_price,
+                "max": max_price
             }
         except Exception as e:
-            print(f"Error in get_price_range: {e}")
-            return {"min": 0, "max": 0}
\ No newline at end of file
+            logger.exception("Error in get_price_range")
+            return {"min": 0, "max": 0}
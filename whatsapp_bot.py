@@ -1,46 +1,157 @@
 # whatsapp_bot.py - Enhanced WhatsApp Bot with Better Error Handling and Response Logic
 
+# When started as a script, serve with gevent if it's installed so blocking
+# HTTP calls yield instead of pinning a thread. Patching has to happen before
+# socket/ssl/threading are imported, and importing this module never patches.
+monkey = None
+if __name__ == "__main__":
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        monkey = None
+
 import os
 import sys
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify
 import logging
-from datetime import datetime
+import logging.handlers
+import atexit
+from datetime import datetime, timedelta
 import uuid
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, NamedTuple, Optional
 import socket
 import sqlite3
 import time
-import streamlit as st
 import re
+import hashlib
+import threading
+import queue
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from itertools import islice
+
+# Use orjson for request and webhook bodies when it's installed
+try:
+    import orjson
+    
+    def json_dumps(obj: Any) -> bytes:
+        """Serialize obj to compact UTF-8 JSON"""
+        return orjson.dumps(obj)
+    
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    
+    def json_dumps(obj: Any) -> bytes:
+        """Serialize obj to compact UTF-8 JSON"""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    
+    json_loads = json.loads
 
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import LangChain components for memory management
 from langchain.memory import ConversationBufferWindowMemory
-from langchain.schema import HumanMessage, AIMessage
 
 # Import your existing components
 from config import DATA_PATH, WHATSAPP_API_TOKEN, WHATSAPP_PHONE_NUMBER_ID
 
-# Configure logging
+# Configure logging; records are handed to a queue and written to the file
+# and console by a background listener, keeping I/O off request threads
+_log_queue = queue.Queue(-1)
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler("whatsapp_bot.log"),
+    logging.StreamHandler()
+]
+for _log_handler in _log_handlers:
+    _log_handler.setFormatter(_log_formatter)
+# The queue handler only merges the message arguments; the listener's
+# handlers apply the full format
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("whatsapp_bot.log"),
-        logging.StreamHandler()
-    ]
+    handlers=[_queue_handler]
 )
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Create Flask app
 app = Flask(__name__)
 
-# Store user memories with LangChain ConversationBufferWindowMemory
-user_memories = {}
+# Encode JSON responses with orjson when it's installed
+if orjson is not None:
+    from flask.json.provider import JSONProvider
+    
+    class OrjsonProvider(JSONProvider):
+        """Flask JSON provider backed by orjson"""
+        
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        
+        def loads(self, s, **kwargs: Any) -> Any:
+            return orjson.loads(s)
+    
+    app.json = OrjsonProvider(app)
+
+# Store user memories with LangChain ConversationBufferWindowMemory, in
+# least-recently-active first order so the oldest can be evicted
+user_memories = OrderedDict()
+
+# Guards inserts, evictions and reordering of user_memories; plain lookups
+# stay lock-free
+_MEM_LOCK = threading.RLock()
+
+# Cap on the number of users kept in memory
+MAX_USERS = int(os.environ.get('WHATSAPP_MAX_USERS', '1000'))
+
+# Users idle for longer than this are dropped by the periodic sweep
+MEMORY_IDLE_TTL = timedelta(days=3)
+MEMORY_SWEEP_INTERVAL = 300  # seconds
+
+# Number of messages of chat history kept for the agent
+CHAT_HISTORY_WINDOW = 20
+
+# Most search results kept per user for paging with "more"
+MAX_REMAINING_PROPERTIES = 200
+
+# Optional shared session store. With REDIS_URL set, pending "more" results
+# and chat history live in Redis so they survive restarts and are visible
+# to every worker process; user_memories stays as the in-process cache
+REDIS_URL = os.environ.get('REDIS_URL')
+SESSION_TTL = 259200  # 3 days, in seconds
+_redis = None
+if REDIS_URL:
+    try:
+        import redis
+        _redis = redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL, max_connections=20))
+        logger.info("Storing WhatsApp sessions in Redis")
+    except ImportError:
+        logger.warning("REDIS_URL is set but the redis package is not installed; keeping sessions in process")
+
+# Property search results are cached by their search parameters, in Redis
+# when configured and otherwise in a small in-process LRU
+SEARCH_CACHE_TTL = 3600  # seconds
+SEARCH_CACHE_SIZE = 256
+_search_cache = OrderedDict()
+_search_cache_lock = threading.Lock()
+
+try:
+    from blake3 import blake3 as _cache_hash
+except ImportError:
+    def _cache_hash(data: bytes):
+        return hashlib.blake2b(data, digest_size=16)
 
 # Get verify token from environment or use a default that matches what WhatsApp expects
 WHATSAPP_VERIFY_TOKEN = os.environ.get('WHATSAPP_VERIFY_TOKEN', 'your_verify_token')
@@ -49,14 +160,59 @@ WHATSAPP_VERIFY_TOKEN = os.environ.get('WHATSAPP_VERIFY_TOKEN', 'your_verify_tok
 WHATSAPP_API_URL = f"https://graph.facebook.com/v22.0/585333798006829/messages"
 
 # Log the API URL for debugging
-logger.info(f"Using WhatsApp API URL: {WHATSAPP_API_URL}")
-logger.info(f"Using WhatsApp Phone Number ID: {WHATSAPP_PHONE_NUMBER_ID}")
-logger.info(f"Verify token: {WHATSAPP_VERIFY_TOKEN}")
-logger.info(f"API Token (first 5 chars): {WHATSAPP_API_TOKEN[:5] if WHATSAPP_API_TOKEN else 'None'}")
+logger.info("Using WhatsApp API URL: %s", WHATSAPP_API_URL)
+logger.info("Using WhatsApp Phone Number ID: %s", WHATSAPP_PHONE_NUMBER_ID)
+logger.info("Verify token: %s", WHATSAPP_VERIFY_TOKEN)
+logger.info("API Token (first 5 chars): %s", WHATSAPP_API_TOKEN[:5] if WHATSAPP_API_TOKEN else 'None')
+
+# Shared HTTP session so Graph API calls reuse keep-alive TLS connections;
+# retries are handled by send_whatsapp_message itself
+_WA_SESSION = requests.Session()
+_WA_SESSION.headers.update({
+    'Authorization': f'Bearer {WHATSAPP_API_TOKEN}',
+    'Content-Type': 'application/json'
+})
+_WA_SESSION.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=Retry(total=0)))
+
+# Result of the last configuration test, reused for CONFIG_CHECK_TTL seconds
+CONFIG_CHECK_TTL = 300
+_cfg_cache = {"ts": 0, "ok": None}
 
 # Test the configuration on startup
 def test_whatsapp_configuration():
-    """Test WhatsApp API configuration on startup"""
+    """Test WhatsApp API configuration, reusing a result less than CONFIG_CHECK_TTL seconds old"""
+    now = time.time()
+    if _cfg_cache["ok"] is not None and now - _cfg_cache["ts"] < CONFIG_CHECK_TTL:
+        return _cfg_cache["ok"]
+    
+    ok = _check_whatsapp_configuration()
+    _cfg_cache.update(ts=now, ok=ok)
+    return ok
+
+_cfg_refresh_lock = threading.Lock()
+
+def refresh_whatsapp_configuration_async():
+    """Re-run a stale configuration test in the background, keeping the cached result meanwhile"""
+    if time.time() - _cfg_cache["ts"] < CONFIG_CHECK_TTL or not _cfg_refresh_lock.acquire(blocking=False):
+        return
+    
+    def refresh():
+        try:
+            _cfg_cache.update(ts=time.time(), ok=_check_whatsapp_configuration())
+        finally:
+            _cfg_refresh_lock.release()
+    
+    threading.Thread(target=refresh, daemon=True).start()
+
+def cached_whatsapp_configuration():
+    """Latest configuration test result, refreshed in the background once stale; only the first check blocks"""
+    if _cfg_cache["ok"] is None:
+        return test_whatsapp_configuration()
+    refresh_whatsapp_configuration_async()
+    return _cfg_cache["ok"]
+
+def _check_whatsapp_configuration():
+    """Test WhatsApp API configuration against the Graph API"""
     logger.info("Testing WhatsApp API configuration...")
     
     if not WHATSAPP_API_TOKEN:
@@ -68,33 +224,88 @@ def test_whatsapp_configuration():
         return False
     
     # Test API connectivity with a simple request
-    headers = {
-        'Authorization': f'Bearer {WHATSAPP_API_TOKEN}',
-        'Content-Type': 'application/json'
-    }
-    
     try:
         # Test with a simple API call to check if credentials work
         test_url = f"https://graph.facebook.com/v22.0/585333798006829"
-        response = requests.get(test_url, headers=headers, timeout=10)
+        response = _WA_SESSION.get(test_url, timeout=10)
         
         if response.status_code == 200:
             logger.info("✅ WhatsApp API configuration test successful!")
-            logger.info(f"Response: {response.json()}")
+            logger.info("Response: %s", response.json())
             return True
         else:
-            logger.error(f"❌ WhatsApp API test failed: {response.status_code} - {response.text}")
+            logger.error("❌ WhatsApp API test failed: %s - %s", response.status_code, response.text)
             return False
     except Exception as e:
-        logger.error(f"❌ WhatsApp API test error: {e}")
+        logger.error("❌ WhatsApp API test error: %s", e)
         return False
 
 # Database helper functions
-def get_db_connection(db_path='data/properties.db'):
-    """Get a database connection with row factory"""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+class SqliteConnectionPool:
+    """Thread-safe pool of SQLite read connections plus one shared write connection"""
+    
+    PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA cache_size=-20000;
+    """
+    
+    def __init__(self, db_path: str, size: int = 4):
+        """
+        Initialize an empty pool; connections are opened on first use
+        
+        Args:
+            db_path: Path to the SQLite database file
+            size: Maximum number of idle read connections kept open
+        """
+        self.db_path = db_path
+        self._readers = queue.LifoQueue(maxsize=size)
+        self._writer = None
+        self._write_lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a tuned connection usable from any thread"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.executescript(self.PRAGMAS)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    @contextmanager
+    def reader(self):
+        """Borrow a read connection, returning it to the pool afterwards"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    @contextmanager
+    def writer(self):
+        """Hold the write connection; writes are serialized behind a lock"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            yield self._writer
+
+# One pool per database file
+_db_pools: Dict[str, SqliteConnectionPool] = {}
+_db_pools_lock = threading.Lock()
+
+@contextmanager
+def get_db_connection(db_path='data/properties.db', write=False):
+    """Get a pooled database connection with row factory for the duration of a with block"""
+    pool = _db_pools.get(db_path)
+    if pool is None:
+        with _db_pools_lock:
+            pool = _db_pools.setdefault(db_path, SqliteConnectionPool(db_path))
+    with (pool.writer() if write else pool.reader()) as conn:
+        yield conn
 
 def verify_database(db_path):
     """Check if database exists and has properties table"""
@@ -102,51 +313,86 @@ def verify_database(db_path):
         raise FileNotFoundError(f"Database not found at {db_path}")
     
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Check if properties table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='properties'")
-        if not cursor.fetchone():
-            conn.close()
-            raise Exception("Database does not have a properties table")
-        
-        # Check if there are properties
-        cursor.execute("SELECT COUNT(*) FROM properties")
-        count = cursor.fetchone()[0]
+        with get_db_connection(db_path) as conn:
+            # Check if properties table exists
+            if not conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='properties'").fetchone():
+                raise Exception("Database does not have a properties table")
+            
+            # Check if there are properties
+            count = conn.execute("SELECT COUNT(*) FROM properties").fetchone()[0]
         
         if count == 0:
-            conn.close()
             raise Exception("Database has no properties")
         
-        logger.info(f"Database verified: {count} properties found")
-        conn.close()
+        logger.info("Database verified: %s properties found", count)
         return True
     except Exception as e:
-        logger.error(f"Database verification failed: {e}")
+        logger.error("Database verification failed: %s", e)
         raise e
 
 # Initialize database
 try:
     verify_database(DATA_PATH)
-    logger.info(f"Database initialized successfully with data path: {DATA_PATH}")
+    logger.info("Database initialized successfully with data path: %s", DATA_PATH)
 except Exception as e:
-    logger.error(f"Error initializing database: {e}")
+    logger.error("Error initializing database: %s", e)
     DATA_PATH = None
 
-def find_free_port(start_port=5000, max_port=9000):
-    """Find a free port to use"""
-    port = start_port
-    while port <= max_port:
+# Database that searches read and preferences are saved to, on cache hits
+# and misses alike; fix_agent's default when DATA_PATH is unavailable
+SEARCH_DB_PATH = DATA_PATH or 'data/properties.db'
+
+def find_free_port(start_port=5000):
+    """Find a free port to use, preferring start_port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.bind(('localhost', port))
-                return port
+            s.bind(('localhost', start_port))
         except OSError:
-            port += 1
+            # Let the OS pick any free port
+            s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+def get_or_create_user_data(sender_id: str) -> Dict[str, Any]:
+    """
+    Get or create the in-memory state for the user
+    
+    The returned entry stays usable even if the user is evicted afterwards,
+    so callers should hold on to it rather than look the user up again.
+    
+    Args:
+        sender_id: WhatsApp ID of the sender
+        
+    Returns:
+        Dict[str, Any]: The user's memory, history and session state
+    """
+    with _MEM_LOCK:
+        user_data = user_memories.get(sender_id)
+        if user_data is None:
+            # Create a new memory with a window of 20 messages (10 human + 10 AI)
+            user_data = user_memories[sender_id] = {
+                "memory": ConversationBufferWindowMemory(
+                    k=CHAT_HISTORY_WINDOW,  # Keep last 20 messages
+                    return_messages=True,
+                    memory_key="chat_history"
+                ),
+                "last_activity": datetime.now(),
+                "remaining_properties": deque(maxlen=MAX_REMAINING_PROPERTIES),
+                "user_preferences": {},
+                "formatted_history": [],
+                "msg_count": 0
+            }
+            logger.info("Created new memory for user %s", sender_id)
+            
+            # Evict the least recently active users beyond the cap
+            while len(user_memories) > MAX_USERS:
+                evicted_id, _ = user_memories.popitem(last=False)
+                logger.info("Evicted memory for inactive user %s", evicted_id)
+        
+        # Update last activity
+        user_data["last_activity"] = datetime.now()
+        user_memories.move_to_end(sender_id)
     
-    # If no ports are available in range, return a default and hope for the best
-    return 8080
+    return user_data
 
 def get_or_create_memory(sender_id: str) -> ConversationBufferWindowMemory:
     """
@@ -158,24 +404,26 @@ def get_or_create_memory(sender_id: str) -> ConversationBufferWindowMemory:
     Returns:
         ConversationBufferWindowMemory: Memory object for the user
     """
-    if sender_id not in user_memories:
-        # Create a new memory with a window of 20 messages (10 human + 10 AI)
-        user_memories[sender_id] = {
-            "memory": ConversationBufferWindowMemory(
-                k=20,  # Keep last 20 messages
-                return_messages=True,
-                memory_key="chat_history"
-            ),
-            "last_activity": datetime.now(),
-            "remaining_properties": [],
-            "user_preferences": {}
-        }
-        logger.info(f"Created new memory for user {sender_id}")
-    
-    # Update last activity
-    user_memories[sender_id]["last_activity"] = datetime.now()
-    
-    return user_memories[sender_id]["memory"]
+    return get_or_create_user_data(sender_id)["memory"]
+
+def sweep_idle_memories():
+    """Drop memories of users idle for longer than MEMORY_IDLE_TTL and reschedule the sweep"""
+    cutoff = datetime.now() - MEMORY_IDLE_TTL
+    try:
+        # Entries are ordered by activity, so stop at the first recent one
+        with _MEM_LOCK:
+            items = list(user_memories.items())
+            for user_id, user_data in items:
+                if user_data["last_activity"] >= cutoff:
+                    break
+                user_memories.pop(user_id, None)
+                logger.info("Dropped idle memory for user %s", user_id)
+    except Exception as e:
+        logger.error("Error sweeping idle memories: %s", e, exc_info=True)
+    finally:
+        timer = threading.Timer(MEMORY_SWEEP_INTERVAL, sweep_idle_memories)
+        timer.daemon = True
+        timer.start()
 
 def get_chat_history(sender_id: str) -> List[Dict]:
     """
@@ -187,18 +435,16 @@ def get_chat_history(sender_id: str) -> List[Dict]:
     Returns:
         List[Dict]: Formatted chat history for the agent
     """
-    memory = get_or_create_memory(sender_id)
-    messages = memory.chat_memory.messages
+    user_data = get_or_create_user_data(sender_id)
     
-    # Convert LangChain messages to the format expected by the agent
-    formatted_history = []
-    for message in messages:
-        if isinstance(message, HumanMessage):
-            formatted_history.append({"role": "human", "content": message.content})
-        elif isinstance(message, AIMessage):
-            formatted_history.append({"role": "ai", "content": message.content})
+    if _redis is not None:
+        try:
+            return [json_loads(entry) for entry in _redis.lrange(f"wa:{sender_id}:history", 0, -1)]
+        except Exception as e:
+            logger.error("Error reading chat history from Redis: %s", e)
     
-    return formatted_history
+    # Kept up to date by save_to_memory
+    return list(user_data["formatted_history"])
 
 def save_to_memory(sender_id: str, human_message: str, ai_message: str):
     """
@@ -209,31 +455,95 @@ def save_to_memory(sender_id: str, human_message: str, ai_message: str):
         human_message: The human's message
         ai_message: The AI's response
     """
-    memory = get_or_create_memory(sender_id)
-    memory.save_context(
+    user_data = get_or_create_user_data(sender_id)
+    user_data["memory"].save_context(
         {"input": human_message},
         {"output": ai_message}
     )
-    logger.info(f"Saved conversation to memory for user {sender_id}")
+    
+    # Keep the agent-formatted history in step, trimmed to the window
+    user_data["msg_count"] += 2
+    formatted_history = user_data["formatted_history"]
+    formatted_history.append({"role": "human", "content": human_message})
+    formatted_history.append({"role": "ai", "content": ai_message})
+    del formatted_history[:-CHAT_HISTORY_WINDOW]
+    
+    if _redis is not None:
+        key = f"wa:{sender_id}:history"
+        try:
+            pipe = _redis.pipeline()
+            pipe.rpush(key, *(json_dumps(entry) for entry in formatted_history[-2:]))
+            pipe.ltrim(key, -CHAT_HISTORY_WINDOW, -1)
+            pipe.expire(key, SESSION_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.error("Error saving chat history to Redis: %s", e)
+    logger.info("Saved conversation to memory for user %s", sender_id)
 
-def send_whatsapp_message(recipient_id: str, message: str, max_retries: int = 3) -> Dict:
+def get_remaining_properties(sender_id: str) -> deque:
     """
-    Send a message to a WhatsApp user with enhanced error handling and retries
+    Get the properties from the user's last search that haven't been shown yet
+    
+    Args:
+        sender_id: WhatsApp ID of the sender
+        
+    Returns:
+        deque: Formatted property cards, empty if there are none
+    """
+    if _redis is not None:
+        try:
+            raw = _redis.get(f"wa:{sender_id}:remaining")
+            return deque(json_loads(raw) if raw else (), maxlen=MAX_REMAINING_PROPERTIES)
+        except Exception as e:
+            logger.error("Error reading remaining properties from Redis: %s", e)
+    
+    user_data = user_memories.get(sender_id)
+    return user_data["remaining_properties"] if user_data else deque(maxlen=MAX_REMAINING_PROPERTIES)
+
+def set_remaining_properties(sender_id: str, properties: List[str]) -> None:
+    """
+    Store the properties still to be shown when the user asks for more
+    
+    Args:
+        sender_id: WhatsApp ID of the sender
+        properties: Formatted property cards not yet shown, at most MAX_REMAINING_PROPERTIES
+    """
+    if not isinstance(properties, deque):
+        properties = deque(properties, maxlen=MAX_REMAINING_PROPERTIES)
+    
+    user_data = user_memories.get(sender_id)
+    if user_data is not None:
+        user_data["remaining_properties"] = properties
+    
+    if _redis is not None:
+        key = f"wa:{sender_id}:remaining"
+        try:
+            if properties:
+                _redis.set(key, json_dumps(list(properties)), ex=SESSION_TTL)
+            else:
+                _redis.delete(key)
+        except Exception as e:
+            logger.error("Error saving remaining properties to Redis: %s", e)
+
+# Fixed leading part of every text message payload
+_PAYLOAD_PREFIX = b'{"messaging_product":"whatsapp","recipient_type":"individual","type":"text","to":"'
+
+def build_text_payload(recipient_id: str, message: str) -> bytes:
+    """
+    Build the JSON request body for a text message
     
     Args:
         recipient_id: WhatsApp ID of the recipient
         message: Text message to send
-        max_retries: Maximum number of retry attempts
         
     Returns:
-        Dict: Response from the WhatsApp API
+        bytes: Encoded payload
     """
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {WHATSAPP_API_TOKEN}'
-    }
+    # WhatsApp IDs are phone numbers, which need no JSON escaping
+    if recipient_id.isdigit():
+        return _PAYLOAD_PREFIX + recipient_id.encode() + b'","text":{"body":' + json_dumps(message) + b'}}'
     
-    payload = {
+    return json_dumps({
         'messaging_product': 'whatsapp',
         'recipient_type': 'individual',
         'to': recipient_id,
@@ -241,75 +551,183 @@ def send_whatsapp_message(recipient_id: str, message: str, max_retries: int = 3)
         'text': {
             'body': message
         }
-    }
+    })
+
+class SendResult(NamedTuple):
+    """Outcome of a WhatsApp send"""
+    ok: bool
+    payload: Dict
+
+# Longest Retry-After wait honoured before giving up on a send; anything
+# longer would stall every sender pinned to the same message worker
+MAX_RETRY_WAIT = 30
+
+def send_whatsapp_message(recipient_id: str, message: str, max_retries: int = 3) -> SendResult:
+    """
+    Send a message to a WhatsApp user with enhanced error handling and retries
+    
+    Args:
+        recipient_id: WhatsApp ID of the recipient
+        message: Text message to send
+        max_retries: Maximum number of retry attempts
+        
+    Returns:
+        SendResult: Whether the send succeeded, and the API response or error details
+    """
+    body = build_text_payload(recipient_id, message)
     
     for attempt in range(max_retries):
         try:
             # Log request details (without full token for security)
-            logger.info(f"📤 Sending message to {recipient_id} (attempt {attempt + 1}/{max_retries})")
-            logger.info(f"🔹 Message preview: {message[:100]}...")
-            logger.info(f"🔹 Using URL: {WHATSAPP_API_URL}")
+            logger.info("📤 Sending message to %s (attempt %s/%s)", recipient_id, attempt + 1, max_retries)
+            logger.info("🔹 Message preview: %.100s...", message)
+            logger.info("🔹 Using URL: %s", WHATSAPP_API_URL)
             
-            response = requests.post(
+            response = _WA_SESSION.post(
                 WHATSAPP_API_URL,
-                headers=headers,
-                json=payload,
+                data=body,
                 timeout=30  # Add timeout
             )
             
             # Log response details
-            logger.info(f"📥 WhatsApp API response:")
-            logger.info(f"🔹 Status Code: {response.status_code}")
-            logger.info(f"🔹 Response Headers: {dict(response.headers)}")
-            logger.info(f"🔹 Response Body: {response.text}")
+            logger.info("📥 WhatsApp API response:")
+            logger.info("🔹 Status Code: %s", response.status_code)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔹 Response Headers: %s", dict(response.headers))
+            logger.info("🔹 Response Body: %s", response.text)
             
             if response.status_code == 200:
                 result = response.json()
-                logger.info(f"✅ Message sent successfully!")
-                logger.info(f"🆔 Message ID: {result.get('messages', [{}])[0].get('id', 'N/A')}")
-                return result
+                logger.info("✅ Message sent successfully!")
+                logger.info("🆔 Message ID: %s", result.get('messages', [{}])[0].get('id', 'N/A'))
+                return SendResult(True, result)
             else:
-                logger.error(f"❌ WhatsApp API error: {response.status_code}")
-                logger.error(f"🔹 Error details: {response.text}")
+                logger.error("❌ WhatsApp API error: %s", response.status_code)
+                logger.error("🔹 Error details: %s", response.text)
                 
                 # Parse error response
                 try:
                     error_data = response.json()
                     error_message = error_data.get('error', {}).get('message', 'Unknown error')
                     error_code = error_data.get('error', {}).get('code', 'Unknown code')
-                    logger.error(f"🔹 Error Code: {error_code}")
-                    logger.error(f"🔹 Error Message: {error_message}")
+                    logger.error("🔹 Error Code: %s", error_code)
+                    logger.error("🔹 Error Message: %s", error_message)
                     
                     # Don't retry for certain errors
                     if response.status_code in [400, 401, 403]:
                         logger.error("❌ Permanent error, not retrying")
-                        return {"error": error_message, "status_code": response.status_code}
+                        return SendResult(False, {"error": error_message, "status_code": response.status_code})
                 except:
                     pass
                 
                 # If this was the last attempt, return error
                 if attempt == max_retries - 1:
-                    return {"error": response.text, "status_code": response.status_code}
+                    return SendResult(False, {"error": response.text, "status_code": response.status_code})
                 
-                # Wait before retrying
-                wait_time = (attempt + 1) * 2  # Exponential backoff
-                logger.info(f"⏳ Waiting {wait_time} seconds before retry...")
+                # Wait before retrying, as long as the API asks if it says.
+                # Sends run on the message workers, so this never holds up a
+                # webhook request thread
+                retry_after = response.headers.get('Retry-After', '')
+                wait_time = int(retry_after) if retry_after.isdigit() else (attempt + 1) * 2  # Exponential backoff
+                if wait_time > MAX_RETRY_WAIT:
+                    logger.error("❌ Retry-After of %s seconds exceeds %s, not retrying", wait_time, MAX_RETRY_WAIT)
+                    return SendResult(False, {"error": "Rate limited", "status_code": response.status_code,
+                                              "retry_after": wait_time})
+                logger.info("⏳ Waiting %s seconds before retry...", wait_time)
                 time.sleep(wait_time)
                 
         except requests.exceptions.Timeout:
-            logger.error(f"⏱️ Request timeout on attempt {attempt + 1}")
+            logger.error("⏱️ Request timeout on attempt %s", attempt + 1)
             if attempt == max_retries - 1:
-                return {"error": "Request timeout"}
+                return SendResult(False, {"error": "Request timeout"})
         except requests.exceptions.ConnectionError:
-            logger.error(f"🔌 Connection error on attempt {attempt + 1}")
+            logger.error("🔌 Connection error on attempt %s", attempt + 1)
             if attempt == max_retries - 1:
-                return {"error": "Connection error"}
+                return SendResult(False, {"error": "Connection error"})
         except Exception as e:
-            logger.error(f"💥 Unexpected error on attempt {attempt + 1}: {e}", exc_info=True)
+            logger.error("💥 Unexpected error on attempt %s: %s", attempt + 1, e, exc_info=True)
             if attempt == max_retries - 1:
-                return {"error": str(e)}
+                return SendResult(False, {"error": str(e)})
+    
+    return SendResult(False, {"error": "All retry attempts failed"})
+
+class RateLimiter:
+    """Token bucket allowing at most `rate` acquisitions per `period` seconds"""
+    
+    def __init__(self, rate: int, period: float = 1.0):
+        """
+        Initialize a full bucket; tokens are topped up lazily on acquire
+        
+        Args:
+            rate: Tokens available per period
+            period: Time in seconds to refill an empty bucket
+        """
+        self._capacity = float(rate)
+        self._tokens = float(rate)
+        self._fill_rate = rate / period
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
     
-    return {"error": "All retry attempts failed"}
+    def acquire(self):
+        """Block until a token is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._fill_rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._fill_rate
+            time.sleep(wait)
+
+# Outbound sends stay under WhatsApp's per-number throughput limit
+WHATSAPP_MESSAGES_PER_SECOND = 50
+_send_limiter = RateLimiter(WHATSAPP_MESSAGES_PER_SECOND)
+
+def send_rate_limited(recipient_id: str, message: str) -> SendResult:
+    """
+    Send a WhatsApp message once the rate limiter allows it
+    
+    Args:
+        recipient_id: WhatsApp ID of the recipient
+        message: Text message to send
+        
+    Returns:
+        SendResult: Whether the send succeeded, and the API response or error details
+    """
+    _send_limiter.acquire()
+    return send_whatsapp_message(recipient_id, message)
+
+def send_property_cards(recipient_id: str, cards: List[str]) -> None:
+    """
+    Send property cards one after another so they arrive in ranked order
+    
+    Args:
+        recipient_id: WhatsApp ID of the recipient
+        cards: Formatted property cards, best match first
+    """
+    for i, card in enumerate(cards, 1):
+        result = send_rate_limited(recipient_id, card)
+        if not result.ok:
+            logger.error("Failed to send property %s: %s", i, result.payload)
+
+# Property card layout and the fields that fill it, in order
+_PROP_TEMPLATE = (
+    "🏢 *{}*\n\n"
+    "📍 *Location*: {}\n"
+    "🏠 *Type*: {}\n"
+    "🛏 *Configuration*: {}\n"
+    "📏 *Size*: {}\n"
+    "💰 *Price*: {}\n"
+    "🗓 *Possession*: {}"
+)
+_PROP_FIELDS = itemgetter('name', 'area', 'type', 'configuration', 'size', 'approx_total_price', 'possession_date')
+
+# Longest text body the WhatsApp API accepts, and the divider used when
+# several property cards are sent in one message
+WHATSAPP_MAX_BODY = 4096
+_CARD_SEPARATOR = "\n\n---\n\n"
 
 def format_property_for_whatsapp(property_data: Dict) -> str:
     """
@@ -321,15 +739,7 @@ def format_property_for_whatsapp(property_data: Dict) -> str:
     Returns:
         str: Formatted message for WhatsApp
     """
-    return (
-        f"🏢 *{property_data['name']}*\n\n"
-        f"📍 *Location*: {property_data['area']}\n"
-        f"🏠 *Type*: {property_data['type']}\n"
-        f"🛏 *Configuration*: {property_data['configuration']}\n"
-        f"📏 *Size*: {property_data['size']}\n"
-        f"💰 *Price*: {property_data['approx_total_price']}\n"
-        f"🗓 *Possession*: {property_data['possession_date']}"
-    )
+    return _PROP_TEMPLATE.format(*_PROP_FIELDS(property_data))
 
 def handle_properties_response(sender_id: str, properties: List[Dict], advice: str) -> None:
     """
@@ -341,117 +751,132 @@ def handle_properties_response(sender_id: str, properties: List[Dict], advice: s
         advice: Advice text to send before properties
     """
     try:
-        # Send advice message first if available
-        if advice:
-            result = send_whatsapp_message(sender_id, f"💡 {advice}")
-            if "error" in result:
-                logger.error(f"Failed to send advice: {result}")
-                return
+        # The advice, summary and header always go out in this order, so send
+        # them as one message instead of three sequential round trips
+        intro = [f"💡 {advice}"] if advice else []
         
-        # Send summary message
         if len(properties) > 0:
-            summary = f"I found {len(properties)} properties matching your criteria."
-            result = send_whatsapp_message(sender_id, summary)
-            if "error" in result:
-                logger.error(f"Failed to send summary: {result}")
-                return
-        
             # Send up to 3 properties in detail
             properties_to_show = min(3, len(properties))
+            intro.append(f"I found {len(properties)} properties matching your criteria.")
+            intro.append(f"Here are the top {properties_to_show} properties:")
+            cards = [format_property_for_whatsapp(prop) for prop in properties[:properties_to_show]]
+            combined = "\n\n".join(intro) + "\n\n" + _CARD_SEPARATOR.join(cards)
             
-            result = send_whatsapp_message(
-                sender_id, 
-                f"Here are the top {properties_to_show} properties:"
-            )
-            if "error" in result:
-                logger.error(f"Failed to send property header: {result}")
-                return
-            
-            for i, prop in enumerate(properties[:properties_to_show], 1):
-                property_message = format_property_for_whatsapp(prop)
-                result = send_whatsapp_message(sender_id, property_message)
-                if "error" in result:
-                    logger.error(f"Failed to send property {i}: {result}")
-                    # Continue with next property instead of stopping
+            if len(combined) <= WHATSAPP_MAX_BODY:
+                # Send the intro and cards as a single message, keeping their ranking
+                result = send_whatsapp_message(sender_id, combined)
+                if not result.ok:
+                    logger.error("Failed to send properties: %s", result.payload)
+                    return
+            else:
+                result = send_whatsapp_message(sender_id, "\n\n".join(intro))
+                if not result.ok:
+                    logger.error("Failed to send property summary: %s", result.payload)
+                    return
                 
-                # Add small delay between messages
-                time.sleep(1)
+                # Too long for one message, send the cards in order, continuing past failures
+                send_property_cards(sender_id, cards)
             
             # If there are more properties, let the user know
             if len(properties) > properties_to_show:
-                remaining = len(properties) - properties_to_show
+                remaining = min(len(properties) - properties_to_show, MAX_REMAINING_PROPERTIES)
                 result = send_whatsapp_message(
                     sender_id,
                     f"There are {remaining} more properties available. Type 'more' to see the next 3 properties."
                 )
-                if "error" not in result:
-                    # Store the remaining properties in the user session
-                    if sender_id in user_memories:
-                        user_memories[sender_id]["remaining_properties"] = properties[properties_to_show:]
+                if result.ok:
+                    # Store the remaining properties in the user session, formatted
+                    # once here so paging through them is just slicing
+                    set_remaining_properties(
+                        sender_id,
+                        [format_property_for_whatsapp(prop) for prop in properties[properties_to_show:properties_to_show + remaining]]
+                    )
             else:
                 # No more properties to show
-                if sender_id in user_memories and "remaining_properties" in user_memories[sender_id]:
-                    user_memories[sender_id]["remaining_properties"] = []
+                set_remaining_properties(sender_id, [])
         else:
-            result = send_whatsapp_message(
-                sender_id, 
-                "I couldn't find any properties matching your exact criteria. Let me suggest some alternatives or try adjusting your preferences."
-            )
-            if "error" in result:
-                logger.error(f"Failed to send no results message: {result}")
+            intro.append("I couldn't find any properties matching your exact criteria. Let me suggest some alternatives or try adjusting your preferences.")
+            result = send_whatsapp_message(sender_id, "\n\n".join(intro))
+            if not result.ok:
+                logger.error("Failed to send no results message: %s", result.payload)
     
     except Exception as e:
-        logger.error(f"Error in handle_properties_response: {e}", exc_info=True)
+        logger.error("Error in handle_properties_response: %s", e, exc_info=True)
+
+# Start the periodic idle-memory sweep
+sweep_idle_memories()
+
+# Patterns for the basic search-parameter extraction fallback
+_AREA_RE = re.compile(r'in\s+([A-Za-z\s]+)', re.IGNORECASE)
+_BHK_RE = re.compile(r'(\d+)\s*bhk', re.IGNORECASE)
+_MSG_KEYWORDS = {'apartment': 'Apartment', 'villa': 'Villa'}
+
+# Commands handled directly by process_whatsapp_message
+_MORE_CMDS = frozenset({'more', 'next', 'show more'})
+_PREFS_RE = re.compile(r'(?:my|current|saved) preferences', re.IGNORECASE)
 
 # Import the fixed agent functions - Updated to work with new fix_agent.py
 try:
-    # Import core functionality from fix_agent
-    from fix_agent import direct_property_search, get_user_preferences
+    # Import core functionality from fix_agent, once at startup
+    from fix_agent import get_user_preferences
+    try:
+        from fix_agent import direct_property_search
+    except ImportError:
+        # fix_agent versions without the direct entry point expose the same search here
+        from fix_agent import improved_property_search as direct_property_search
     
     # Define adapter functions to maintain compatibility
     def search_properties_directly(sender_id, **kwargs):
         """Adapter function to call direct_property_search with session_id"""
         # Add session_id to kwargs
         kwargs['session_id'] = sender_id
+        kwargs['db_path'] = SEARCH_DB_PATH
         return direct_property_search(**kwargs)
     
     def get_user_preferences_from_memory(sender_id):
         """Adapter function to get user preferences"""
-        # Configure session ID in streamlit state
-        st.session_state = {'session_id': sender_id}
-        return get_user_preferences()
+        return get_user_preferences(session_id=sender_id, db_path=SEARCH_DB_PATH)
+    
+    try:
+        from fix_agent import process_natural_language
+    except ImportError:
+        process_natural_language = None
+    
+    @lru_cache(maxsize=4096)
+    def _extract_search_params(message):
+        """Extract search parameters from a stripped message, as a tuple of items"""
+        preferences = {}
+        if process_natural_language is not None:
+            process_natural_language(message, preferences)
+            return tuple(preferences.items())
+        
+        # Fallback to basic extraction if process_natural_language is not available
+        # Extract area (basic implementation)
+        area_match = _AREA_RE.search(message)
+        if area_match:
+            preferences['area'] = area_match.group(1).strip()
+        
+        # Extract property type
+        lower = message.lower()
+        for keyword, property_type in _MSG_KEYWORDS.items():
+            if keyword in lower:
+                preferences['property_type'] = property_type
+                break
+        
+        # Extract BHK
+        bhk_match = _BHK_RE.search(message)
+        if bhk_match:
+            preferences['configurations'] = f"{bhk_match.group(1)}BHK"
+        
+        return tuple(preferences.items())
     
     def extract_search_params_from_message(message, chat_history=None, user_prefs=None):
         """
         Extract search parameters from user message
         Uses the process_natural_language function from fix_agent if available
         """
-        try:
-            from fix_agent import process_natural_language
-            preferences = {}
-            process_natural_language(message, preferences)
-            return preferences
-        except ImportError:
-            # Fallback to basic extraction if process_natural_language is not available
-            preferences = {}
-            
-            # Extract area (basic implementation)
-            area_match = re.search(r'in\s+([A-Za-z\s]+)', message, re.IGNORECASE)
-            if area_match:
-                preferences['area'] = area_match.group(1).strip()
-            
-            # Extract property type
-            if 'apartment' in message.lower():
-                preferences['property_type'] = 'Apartment'
-            elif 'villa' in message.lower():
-                preferences['property_type'] = 'Villa'
-            
-            # Extract BHK
-            bhk_match = re.search(r'(\d+)\s*bhk', message, re.IGNORECASE)
-            if bhk_match:
-                preferences['configurations'] = f"{bhk_match.group(1)}BHK"
-            
-            return preferences
+        return dict(_extract_search_params(message.strip()))
     
     def create_response_with_context(message, chat_history=None, search_results=None):
         """Generate a response based on context"""
@@ -476,10 +901,10 @@ try:
     
     logger.info("✅ Successfully imported and adapted functions from fix_agent")
 except ImportError as e:
-    logger.error(f"❌ Failed to import from fix_agent: {e}")
+    logger.error("❌ Failed to import from fix_agent: %s", e)
     # Provide fallback functions
     def search_properties_directly(*args, **kwargs):
-        return {"properties": [], "count": 0, "advice": "Property search not available"}
+        return {"properties": [], "count": 0, "advice": "Property search not available", "error": "Property search not available"}
     
     def get_user_preferences_from_memory(*args, **kwargs):
         return {"has_preferences": False, "message": "Preferences not available"}
@@ -490,6 +915,97 @@ except ImportError as e:
     def create_response_with_context(*args, **kwargs):
         return "I'm sorry, the system is not fully available right now."
 
+def _get_cached_search(key: str) -> Optional[Dict]:
+    """Get an unexpired cached search result, or None"""
+    if _redis is not None:
+        try:
+            cached = _redis.get(key)
+            return json_loads(cached) if cached else None
+        except Exception as e:
+            logger.error("Error reading search cache from Redis: %s", e)
+            return None
+    
+    with _search_cache_lock:
+        entry = _search_cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            _search_cache.move_to_end(key)
+            return entry[1]
+    return None
+
+def _store_search_preferences(sender_id: str, search_params: Dict) -> None:
+    """Save a search as the sender's preferences, as the uncached search does"""
+    if not any(search_params.get(name) for name in (
+            'area', 'property_type', 'min_budget', 'max_budget',
+            'configurations', 'possession_date', 'min_size', 'max_size')):
+        return
+    try:
+        from utils.db_setup import store_user_preferences
+        store_user_preferences(
+            session_id=sender_id,
+            area=search_params.get('area'),
+            property_type=search_params.get('property_type'),
+            min_budget=search_params.get('min_budget'),
+            max_budget=search_params.get('max_budget'),
+            configuration=search_params.get('configurations'),
+            possession_date=search_params.get('possession_date'),
+            min_size=search_params.get('min_size'),
+            max_size=search_params.get('max_size'),
+            db_path=SEARCH_DB_PATH
+        )
+    except Exception as e:
+        logger.error("Error storing preferences for %s: %s", sender_id, e)
+
+def cached_property_search(sender_id: str, search_params: Dict) -> Dict:
+    """
+    Run a property search, reusing the result of an identical recent search
+    
+    Args:
+        sender_id: WhatsApp ID of the sender
+        search_params: Extracted search parameters
+        
+    Returns:
+        Dict: Search results with properties and advice
+    """
+    key = "wa:resp:" + _cache_hash(json_dumps(sorted(search_params.items()))).hexdigest()[:32]
+    
+    cached = _get_cached_search(key)
+    if cached is not None:
+        # The search saves the sender's preferences as it runs, so a cache
+        # hit has to save them itself
+        _store_search_preferences(sender_id, search_params)
+        return cached
+    
+    search_results = search_properties_directly(sender_id, **search_params)
+    
+    # Don't cache failed searches
+    if not search_results or "error" in search_results:
+        return search_results
+    
+    if _redis is not None:
+        try:
+            _redis.setex(key, SEARCH_CACHE_TTL, json_dumps(search_results))
+        except Exception as e:
+            logger.error("Error saving search cache to Redis: %s", e)
+    else:
+        with _search_cache_lock:
+            _search_cache[key] = (time.monotonic() + SEARCH_CACHE_TTL, search_results)
+            _search_cache.move_to_end(key)
+            while len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
+    
+    return search_results
+
+# (second, ISO string) of the last timestamp handed out by _iso_now
+_iso_cache = (0, '')
+
+def _iso_now() -> str:
+    """Current local time as an ISO 8601 string, reformatted at most once a second"""
+    global _iso_cache
+    now = int(time.time())
+    if _iso_cache[0] != now:
+        _iso_cache = (now, datetime.fromtimestamp(now).isoformat())
+    return _iso_cache[1]
+
 # Add a root route for basic testing
 @app.route('/', methods=['GET'])
 def home():
@@ -498,7 +1014,7 @@ def home():
         "status": "ok",
         "message": "WhatsApp Real Estate Assistant webhook server is running",
         "active_users": len(user_memories),
-        "whatsapp_api_test": test_whatsapp_configuration(),
+        "whatsapp_api_test": cached_whatsapp_configuration(),
         "endpoints": {
             "/webhook": "WhatsApp webhook endpoint",
             "/webhook-test": "Test endpoint for webhook configuration",
@@ -513,10 +1029,11 @@ def home():
 def memory_stats():
     """View memory statistics for debugging"""
     stats = {}
-    for user_id, user_data in user_memories.items():
-        memory = user_data["memory"]
+    with _MEM_LOCK:
+        items = list(user_memories.items())
+    for user_id, user_data in items:
         stats[user_id] = {
-            "message_count": len(memory.chat_memory.messages),
+            "message_count": user_data["msg_count"],
             "last_activity": user_data["last_activity"].isoformat(),
             "has_remaining_properties": len(user_data.get("remaining_properties", [])) > 0,
             "has_preferences": len(user_data.get("user_preferences", {})) > 0
@@ -543,10 +1060,10 @@ def test_send():
             recipient = request.args.get('phone', '919100246849')
             message = request.args.get('message', 'Test message from Hyderabad Real Estate Assistant')
         
-        logger.info(f"🧪 Testing message send to {recipient}")
+        logger.info("🧪 Testing message send to %s", recipient)
         
-        # Check if configuration is valid
-        if not test_whatsapp_configuration():
+        # Check if configuration is valid, using the cached result when there is one
+        if not cached_whatsapp_configuration():
             return jsonify({
                 "status": "error",
                 "message": "WhatsApp API configuration test failed. Check your tokens and phone number ID."
@@ -556,14 +1073,14 @@ def test_send():
         result = send_whatsapp_message(recipient, message)
         
         return jsonify({
-            "status": "success" if "error" not in result else "error", 
+            "status": "success" if result.ok else "error", 
             "recipient": recipient, 
             "message": message, 
-            "result": result,
-            "timestamp": datetime.now().isoformat()
+            "result": result.payload,
+            "timestamp": _iso_now()
         })
     except Exception as e:
-        logger.error(f"Error sending test message: {e}", exc_info=True)
+        logger.error("Error sending test message: %s", e, exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 # Webhook verification route
@@ -573,52 +1090,76 @@ def verify_webhook():
     Verify the webhook for WhatsApp API
     """
     # Log all request parameters for debugging
-    logger.info(f"🔍 Webhook verification request received")
-    logger.info(f"🔹 Query params: {dict(request.args)}")
-    logger.info(f"🔹 Headers: {dict(request.headers)}")
+    logger.info("🔍 Webhook verification request received")
+    logger.info("🔹 Query params: %s", dict(request.args))
+    logger.info("🔹 Headers: %s", dict(request.headers))
     
     # WhatsApp sends a verification token
     verify_token = request.args.get('hub.verify_token')
     mode = request.args.get('hub.mode')
     challenge = request.args.get('hub.challenge')
     
-    logger.info(f"🔑 Verifying webhook:")
-    logger.info(f"🔹 Mode: {mode}")
-    logger.info(f"🔹 Received token: {verify_token}")
-    logger.info(f"🔹 Expected token: {WHATSAPP_VERIFY_TOKEN}")
-    logger.info(f"🔹 Challenge: {challenge}")
-    logger.info(f"🔹 Token match: {verify_token == WHATSAPP_VERIFY_TOKEN}")
+    logger.info("🔑 Verifying webhook:")
+    logger.info("🔹 Mode: %s", mode)
+    logger.info("🔹 Received token: %s", verify_token)
+    logger.info("🔹 Expected token: %s", WHATSAPP_VERIFY_TOKEN)
+    logger.info("🔹 Challenge: %s", challenge)
+    logger.info("🔹 Token match: %s", verify_token == WHATSAPP_VERIFY_TOKEN)
     
     # Check if the verification token matches your token
     if mode == 'subscribe' and verify_token == WHATSAPP_VERIFY_TOKEN:
-        logger.info(f"✅ Webhook verified successfully, returning challenge: {challenge}")
+        logger.info("✅ Webhook verified successfully, returning challenge: %s", challenge)
         return challenge, 200
     
-    logger.error(f"❌ Webhook verification failed.")
-    logger.error(f"🔹 Expected mode: 'subscribe', received: '{mode}'")
-    logger.error(f"🔹 Expected token: '{WHATSAPP_VERIFY_TOKEN}', received: '{verify_token}'")
+    logger.error("❌ Webhook verification failed.")
+    logger.error("🔹 Expected mode: 'subscribe', received: '%s'", mode)
+    logger.error("🔹 Expected token: '%s', received: '%s'", WHATSAPP_VERIFY_TOKEN, verify_token)
     return jsonify({"error": "Verification failed", "expected_token": WHATSAPP_VERIFY_TOKEN}), 403
 
+def _extract_text_body(message: Dict) -> Optional[str]:
+    """Get the text of a plain text message"""
+    return message.get('text', {}).get('body')
+
+def _extract_interactive_title(message: Dict) -> Optional[str]:
+    """Get the chosen title of an interactive (button or list) reply"""
+    interactive = message.get('interactive', {})
+    reply_type = interactive.get('type')
+    if reply_type in ('button_reply', 'list_reply'):
+        return interactive.get(reply_type, {}).get('title')
+    return None
+
+# Message text extractors keyed by WhatsApp message type
+_MESSAGE_TEXT_EXTRACTORS = {
+    'text': _extract_text_body,
+    'interactive': _extract_interactive_title,
+}
+
 # Webhook message handling route
 @app.route('/webhook', methods=['POST'])
 def webhook_post():
     """Enhanced webhook handler for WhatsApp API with better message parsing"""
     try:
-        # Log request details
-        request_data = request.get_data(as_text=True)
-        logger.info(f"📬 WEBHOOK POST - Received data: {request_data}")
+        logger.info("📬 WEBHOOK POST - Received data")
         
         # Get client IP for security
         client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        logger.info(f"🌐 Request from IP: {client_ip}")
+        logger.info("🌐 Request from IP: %s", client_ip)
         
         try:
-            data = request.json
+            # Parse the body once
+            body = request.get_data()
+            try:
+                data = json_loads(body) if body else None
+            except ValueError as e:
+                logger.error("❌ JSON decode error: %s", e)
+                logger.error("🔹 Raw data: %s", body[:512].decode('utf-8', 'replace'))
+                return jsonify({"status": "error", "message": "Invalid JSON"}), 400
             if not data:
                 logger.warning("⚠️ No JSON data received")
                 return jsonify({"status": "error", "message": "No JSON data"}), 400
             
-            logger.info(f"📋 Parsed JSON data: {json.dumps(data, indent=2)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📋 Parsed JSON data: %s", json.dumps(data, indent=2))
             
             # Enhanced message parsing
             processed_messages = 0
@@ -626,7 +1167,7 @@ def webhook_post():
             # Check if it's a WhatsApp webhook format
             if 'entry' in data:
                 for entry in data.get('entry', []):
-                    logger.info(f"🔍 Processing entry: {entry}")
+                    logger.info("🔍 Processing entry: %s", entry)
                     
                     # Handle messages
                     for change in entry.get('changes', []):
@@ -636,98 +1177,77 @@ def webhook_post():
                             # Get metadata
                             metadata = value.get('metadata', {})
                             phone_number_id = metadata.get('phone_number_id')
-                            logger.info(f"📞 Message for phone number ID: {phone_number_id}")
+                            logger.info("📞 Message for phone number ID: %s", phone_number_id)
                             
                             # Process each message
                             messages = value.get('messages', [])
                             for message in messages:
-                                sender_id = message.get('from')
-                                message_id = message.get('id')
-                                timestamp = message.get('timestamp')
+                                mget = message.get
+                                mtype = mget('type')
+                                sender_id = mget('from')
                                 
-                                logger.info(f"📨 Processing message:")
-                                logger.info(f"🔹 From: {sender_id}")
-                                logger.info(f"🔹 ID: {message_id}")
-                                logger.info(f"🔹 Timestamp: {timestamp}")
-                                logger.info(f"🔹 Type: {message.get('type')}")
+                                logger.info("📨 Processing message:")
+                                logger.info("🔹 From: %s", sender_id)
+                                logger.info("🔹 ID: %s", mget('id'))
+                                logger.info("🔹 Timestamp: %s", mget('timestamp'))
+                                logger.info("🔹 Type: %s", mtype)
                                 
                                 # Extract message text based on type
-                                message_text = None
-                                
-                                if message.get('type') == 'text':
-                                    message_text = message.get('text', {}).get('body')
-                                elif message.get('type') == 'interactive':
-                                    # Handle interactive messages (buttons, lists, etc.)
-                                    interactive = message.get('interactive', {})
-                                    if interactive.get('type') == 'button_reply':
-                                        message_text = interactive.get('button_reply', {}).get('title')
-                                    elif interactive.get('type') == 'list_reply':
-                                        message_text = interactive.get('list_reply', {}).get('title')
+                                extract_text = _MESSAGE_TEXT_EXTRACTORS.get(mtype)
+                                message_text = extract_text(message) if extract_text else None
                                 
                                 if message_text and sender_id:
-                                    logger.info(f"✅ Found valid message: '{message_text}' from {sender_id}")
+                                    logger.info("✅ Found valid message: '%s' from %s", message_text, sender_id)
                                     
                                     # Process the message asynchronously to avoid timeout
-                                    try:
-                                        process_whatsapp_message(sender_id, message_text)
+                                    if enqueue_message(sender_id, message_text):
                                         processed_messages += 1
-                                    except Exception as process_error:
-                                        logger.error(f"❌ Error processing message: {process_error}", exc_info=True)
-                                        # Send an error message to the user
-                                        try:
-                                            send_whatsapp_message(
-                                                sender_id, 
-                                                "I apologize, but I'm experiencing technical difficulties. Please try again in a moment."
-                                            )
-                                        except:
-                                            pass
                                 else:
-                                    logger.warning(f"⚠️ Could not extract message text or sender ID")
-                                    logger.warning(f"🔹 Message: {message}")
+                                    logger.warning("⚠️ Could not extract message text or sender ID")
+                                    logger.warning("🔹 Message: %s", message)
                             
                             # Handle message status updates
                             statuses = value.get('statuses', [])
                             for status in statuses:
-                                logger.info(f"📊 Message status update: {status}")
+                                logger.info("📊 Message status update: %s", status)
             else:
-                logger.warning(f"⚠️ Unexpected webhook format: {data}")
+                logger.warning("⚠️ Unexpected webhook format: %s", data)
             
             # Log summary
-            logger.info(f"📈 Processed {processed_messages} messages")
+            logger.info("📈 Processed %s messages", processed_messages)
             
             return jsonify({
                 "status": "success", 
                 "processed_messages": processed_messages,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": _iso_now()
             }), 200
             
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON decode error: {e}")
-            logger.error(f"🔹 Raw data: {request_data}")
-            return jsonify({"status": "error", "message": "Invalid JSON"}), 400
         except Exception as e:
-            logger.error(f"❌ Error processing webhook data: {e}", exc_info=True)
+            logger.error("❌ Error processing webhook data: %s", e, exc_info=True)
             return jsonify({"status": "error", "message": str(e)}), 500
     
     except Exception as e:
-        logger.error(f"❌ WEBHOOK POST - Critical error: {e}", exc_info=True)
+        logger.error("❌ WEBHOOK POST - Critical error: %s", e, exc_info=True)
         return jsonify({"status": "error", "message": "Internal server error"}), 500
 
+# Parts of the /webhook-test response that don't change while running
+_WEBHOOK_TEST_STATIC = {
+    "status": "webhook test endpoint",
+    "environment_verify_token": WHATSAPP_VERIFY_TOKEN[:3] + "..." if WHATSAPP_VERIFY_TOKEN and len(WHATSAPP_VERIFY_TOKEN) > 3 else "not set",
+    "whatsapp_phone_id": WHATSAPP_PHONE_NUMBER_ID,
+    "whatsapp_api_url": WHATSAPP_API_URL,
+    "data_path": DATA_PATH,
+    "database_connected": DATA_PATH is not None,
+}
+
 @app.route('/webhook-test', methods=['GET'])
 def test_webhook():
     """Test endpoint to verify webhook configuration"""
-    config_status = test_whatsapp_configuration()
-    
     return jsonify({
-        "status": "webhook test endpoint",
-        "environment_verify_token": WHATSAPP_VERIFY_TOKEN[:3] + "..." if WHATSAPP_VERIFY_TOKEN and len(WHATSAPP_VERIFY_TOKEN) > 3 else "not set",
-        "whatsapp_phone_id": WHATSAPP_PHONE_NUMBER_ID,
-        "whatsapp_api_url": WHATSAPP_API_URL,
-        "data_path": DATA_PATH,
-        "database_connected": DATA_PATH is not None,
-        "whatsapp_config_valid": config_status,
+        **_WEBHOOK_TEST_STATIC,
+        "whatsapp_config_valid": cached_whatsapp_configuration(),
         "active_users": len(user_memories),
-        "timestamp": datetime.now().isoformat()
+        "timestamp": _iso_now()
     })
 
 # Manual message processing endpoint
@@ -735,7 +1255,11 @@ def test_webhook():
 def process_message():
     """Manual message processing endpoint for testing"""
     try:
-        data = request.json
+        body = request.get_data()
+        try:
+            data = json_loads(body) if body else None
+        except ValueError:
+            return jsonify({"status": "error", "message": "Invalid JSON"}), 400
         
         if not data:
             return jsonify({"status": "error", "message": "No JSON data provided"}), 400
@@ -749,7 +1273,7 @@ def process_message():
                 "message": "Both 'sender_id' and 'message' are required"
             }), 400
         
-        logger.info(f"🔧 Manual processing: sender={sender_id}, message={message}")
+        logger.info("🔧 Manual processing: sender=%s, message=%s", sender_id, message)
         
         # Process the message
         process_whatsapp_message(sender_id, message)
@@ -759,19 +1283,68 @@ def process_message():
             "message": "Message processed successfully",
             "sender_id": sender_id,
             "processed_message": message,
-            "memory_messages": len(user_memories.get(sender_id, {}).get("memory", ConversationBufferWindowMemory()).chat_memory.messages),
-            "timestamp": datetime.now().isoformat()
+            "memory_messages": user_memories.get(sender_id, {}).get("msg_count", 0),
+            "timestamp": _iso_now()
         })
         
     except Exception as e:
-        logger.error(f"Error in manual processing: {e}", exc_info=True)
+        logger.error("Error in manual processing: %s", e, exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.before_request
 def log_request_info():
     """Log every request for debugging"""
-    if request.path not in ['/favicon.ico', '/']:  # Skip favicon and home requests
-        logger.info(f"📥 Request: {request.method} {request.path}")
+    if logger.isEnabledFor(logging.DEBUG) and request.path not in ('/favicon.ico', '/'):  # Skip favicon and home requests
+        logger.debug("📥 Request: %s %s", request.method, request.path)
+
+# Inbound messages are processed by background workers so the webhook can
+# acknowledge immediately. Each sender is pinned to one worker's queue so
+# their messages are still handled one at a time and in order. Workers spend
+# most of their time waiting on the LLM and Graph API, so run plenty of them.
+WORKER_COUNT = int(os.environ.get('WHATSAPP_WORKERS', '32'))
+WORK_QUEUE_SIZE = 1000
+_WORK_QUEUES = [queue.Queue(maxsize=WORK_QUEUE_SIZE) for _ in range(WORKER_COUNT)]
+
+def enqueue_message(sender_id: str, message_text: str) -> bool:
+    """
+    Queue a message for background processing
+    
+    Args:
+        sender_id: WhatsApp ID of the sender
+        message_text: Message text from the user
+        
+    Returns:
+        bool: True if queued, False if the worker's queue is full
+    """
+    work_queue = _WORK_QUEUES[hash(sender_id) % WORKER_COUNT]
+    try:
+        work_queue.put_nowait((sender_id, message_text))
+        return True
+    except queue.Full:
+        logger.error("❌ Work queue full, dropping message from %s", sender_id)
+        return False
+
+def _worker(work_queue: queue.Queue) -> None:
+    """Process queued messages forever"""
+    while True:
+        sender_id, message_text = work_queue.get()
+        try:
+            process_whatsapp_message(sender_id, message_text)
+        except Exception as process_error:
+            logger.error("❌ Error processing message: %s", process_error, exc_info=True)
+            # Send an error message to the user
+            try:
+                send_whatsapp_message(
+                    sender_id, 
+                    "I apologize, but I'm experiencing technical difficulties. Please try again in a moment."
+                )
+            except:
+                pass
+        finally:
+            work_queue.task_done()
+
+for _index, _work_queue in enumerate(_WORK_QUEUES):
+    threading.Thread(target=_worker, args=(_work_queue,), daemon=True, name=f"whatsapp-worker-{_index}").start()
 
 def process_whatsapp_message(sender_id: str, message_text: str) -> None:
     """
@@ -781,7 +1354,7 @@ def process_whatsapp_message(sender_id: str, message_text: str) -> None:
         sender_id: WhatsApp ID of the sender
         message_text: Message text from the user
     """
-    logger.info(f"🔄 Processing message from {sender_id}: {message_text}")
+    logger.info("🔄 Processing message from %s: %s", sender_id, message_text)
     
     # Check if database is available
     if DATA_PATH is None:
@@ -799,51 +1372,50 @@ def process_whatsapp_message(sender_id: str, message_text: str) -> None:
     
     try:
         # Get or create memory for this user
-        memory = get_or_create_memory(sender_id)
+        user_data = get_or_create_user_data(sender_id)
         
         # Get chat history and user preferences
         chat_history = get_chat_history(sender_id)
-        user_prefs = user_memories[sender_id].get("user_preferences", {})
+        user_prefs = user_data.get("user_preferences", {})
         
         # Check if user is asking for more properties
-        if message_text.lower() in ['more', 'next', 'show more']:
-            if sender_id in user_memories and user_memories[sender_id]["remaining_properties"]:
-                remaining = user_memories[sender_id]["remaining_properties"]
+        if message_text.lower() in _MORE_CMDS:
+            remaining = get_remaining_properties(sender_id)
+            if remaining:
                 properties_to_show = min(3, len(remaining))
                 
-                result = send_whatsapp_message(sender_id, f"Here are the next {properties_to_show} properties:")
-                if "error" in result:
-                    logger.error(f"Failed to send 'more properties' header: {result}")
-                    return
-                
-                for i, prop in enumerate(remaining[:properties_to_show], 1):
-                    property_message = format_property_for_whatsapp(prop)
-                    result = send_whatsapp_message(sender_id, property_message)
-                    if "error" in result:
-                        logger.error(f"Failed to send property {i}: {result}")
-                        continue
-                    time.sleep(1)  # Add delay between messages
-                
-                # Update remaining properties
-                user_memories[sender_id]["remaining_properties"] = remaining[properties_to_show:]
+                still_remaining = len(remaining) - properties_to_show
+                header = f"Here are the next {properties_to_show} properties:"
+                cards = list(islice(remaining, properties_to_show))
+                if still_remaining > 0:
+                    tail = f"There are {still_remaining} more properties available. Type 'more' to see the next 3 properties."
+                else:
+                    tail = "That's all the properties I have for you. Ask me anything else about real estate in Hyderabad!"
+                combined = header + "\n\n" + _CARD_SEPARATOR.join(cards) + "\n\n" + tail
                 
-                # If there are still more properties, let the user know
-                if len(remaining) > properties_to_show:
-                    still_remaining = len(remaining) - properties_to_show
-                    result = send_whatsapp_message(
-                        sender_id,
-                        f"There are {still_remaining} more properties available. Type 'more' to see the next 3 properties."
-                    )
-                    if "error" in result:
-                        logger.error(f"Failed to send remaining count: {result}")
+                if len(combined) <= WHATSAPP_MAX_BODY:
+                    # Send the header, cards and follow-up as a single message
+                    result = send_whatsapp_message(sender_id, combined)
+                    if not result.ok:
+                        logger.error("Failed to send 'more properties' message: %s", result.payload)
+                        return
                 else:
-                    result = send_whatsapp_message(
-                        sender_id,
-                        "That's all the properties I have for you. Ask me anything else about real estate in Hyderabad!"
-                    )
-                    if "error" in result:
-                        logger.error(f"Failed to send completion message: {result}")
-                    user_memories[sender_id]["remaining_properties"] = []
+                    result = send_whatsapp_message(sender_id, header)
+                    if not result.ok:
+                        logger.error("Failed to send 'more properties' header: %s", result.payload)
+                        return
+                    
+                    # Too long for one message, send the cards in order instead
+                    send_property_cards(sender_id, cards)
+                    
+                    result = send_whatsapp_message(sender_id, tail)
+                    if not result.ok:
+                        logger.error("Failed to send remaining count: %s", result.payload)
+                
+                # Drop the shown properties from the front of the queue
+                for _ in range(properties_to_show):
+                    remaining.popleft()
+                set_remaining_properties(sender_id, remaining)
                 
                 # Save to memory
                 save_to_memory(sender_id, message_text, f"Showed {properties_to_show} more properties")
@@ -853,27 +1425,26 @@ def process_whatsapp_message(sender_id: str, message_text: str) -> None:
                     sender_id,
                     "I don't have any more properties to show you from your last search. Please let me know what kind of property you're looking for."
                 )
-                if "error" in result:
-                    logger.error(f"Failed to send no more properties message: {result}")
+                if not result.ok:
+                    logger.error("Failed to send no more properties message: %s", result.payload)
                 return
         
         # Check if user is asking for preferences
-        if any(phrase in message_text.lower() for phrase in ['my preferences', 'current preferences', 'saved preferences']):
+        if _PREFS_RE.search(message_text):
             prefs_result = get_user_preferences_from_memory(sender_id)
             
             if prefs_result["has_preferences"]:
-                prefs_list = []
-                for key, value in prefs_result["preferences"].items():
-                    prefs_list.append(f"• {key.replace('_', ' ').title()}: {value}")
-                
-                response_text = f"📋 Your Current Preferences:\n\n" + "\n".join(prefs_list)
+                response_text = "📋 Your Current Preferences:\n\n" + "\n".join(
+                    f"• {key.replace('_', ' ').title()}: {value}"
+                    for key, value in prefs_result["preferences"].items()
+                )
                 response_text += "\n\nYou can update any of these by telling me your new preferences!"
             else:
                 response_text = prefs_result["message"]
             
             result = send_whatsapp_message(sender_id, response_text)
-            if "error" in result:
-                logger.error(f"Failed to send preferences: {result}")
+            if not result.ok:
+                logger.error("Failed to send preferences: %s", result.payload)
             else:
                 save_to_memory(sender_id, message_text, response_text)
             return
@@ -886,28 +1457,18 @@ def process_whatsapp_message(sender_id: str, message_text: str) -> None:
         
         # If we have search parameters, perform the search
         if search_params:
-            logger.info(f"🔍 Extracted search params: {search_params}")
-            
-            # Set up session ID in st.session_state for direct_property_search to use
-            import streamlit as st
-            st.session_state = {'session_id': sender_id}
+            logger.info("🔍 Extracted search params: %s", search_params)
             
             # Perform property search directly with the extracted parameters
-            try:
-                # Try using direct_property_search from fix_agent
-                from fix_agent import direct_property_search
-                search_results = direct_property_search(**search_params)
-            except (ImportError, AttributeError):
-                # Fallback to our adapter function
-                search_results = search_properties_directly(sender_id, **search_params)
+            search_results = cached_property_search(sender_id, search_params)
             
             # Update response based on search results
             final_response = create_response_with_context(message_text, chat_history, search_results)
             
             # Send the response
             result = send_whatsapp_message(sender_id, final_response)
-            if "error" in result:
-                logger.error(f"Failed to send search response: {result}")
+            if not result.ok:
+                logger.error("Failed to send search response: %s", result.payload)
                 # Try sending a simplified error message
                 send_whatsapp_message(sender_id, "I found some properties but had trouble sending the details. Please try again.")
                 return
@@ -923,25 +1484,25 @@ def process_whatsapp_message(sender_id: str, message_text: str) -> None:
         else:
             # No search parameters found, just send conversational response
             result = send_whatsapp_message(sender_id, initial_response)
-            if "error" in result:
-                logger.error(f"Failed to send conversational response: {result}")
+            if not result.ok:
+                logger.error("Failed to send conversational response: %s", result.payload)
                 # Try sending a simplified message
                 send_whatsapp_message(sender_id, "I'm here to help you with real estate in Hyderabad. What can I assist you with?")
             else:
                 save_to_memory(sender_id, message_text, initial_response)
         
-        logger.info(f"✅ Successfully processed message. Memory now has {len(memory.chat_memory.messages)} messages")
+        logger.info("✅ Successfully processed message. Memory now has %s messages", user_memories.get(sender_id, {}).get('msg_count', 0))
         
     except Exception as e:
-        logger.error(f"💥 Error processing message: {e}", exc_info=True)
+        logger.error("💥 Error processing message: %s", e, exc_info=True)
         # Send error message to user
         try:
             error_response = "I apologize, but I encountered an error while processing your message. Please try rephrasing your request or try again later."
             result = send_whatsapp_message(sender_id, error_response)
-            if "error" not in result:
+            if result.ok:
                 save_to_memory(sender_id, message_text, error_response)
         except Exception as send_error:
-            logger.error(f"❌ Failed to send error message: {send_error}")
+            logger.error("❌ Failed to send error message: %s", send_error)
 
 def run_whatsapp_bot(host='0.0.0.0', port=None):
     """
@@ -971,7 +1532,7 @@ def run_whatsapp_bot(host='0.0.0.0', port=None):
     if port is None:
         port = find_free_port()
     
-    logger.info(f"🌐 Starting server on {host}:{port}")
+    logger.info("🌐 Starting server on %s:%s", host, port)
     print(f"\n{'='*60}")
     print(f"🏡 WhatsApp Real Estate Assistant Bot Starting...")
     print(f"{'='*60}")
@@ -994,9 +1555,14 @@ def run_whatsapp_bot(host='0.0.0.0', port=None):
     
     # Run the Flask app
     try:
-        app.run(host=host, port=port, debug=False, threaded=True)
+        # Only use gevent's server if the standard library was patched at startup
+        if monkey is not None:
+            from gevent.pywsgi import WSGIServer
+            WSGIServer((host, port), app).serve_forever()
+        else:
+            app.run(host=host, port=port, debug=False, threaded=True)
     except Exception as e:
-        logger.error(f"❌ Failed to start server: {e}")
+        logger.error("❌ Failed to start server: %s", e)
         print(f"❌ Failed to start server: {e}")
 
 if __name__ == "__main__":